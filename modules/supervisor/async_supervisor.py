@@ -1,34 +1,83 @@
 import asyncio
+import dataclasses
+import math
 import time
-import random
 from typing import Optional
 import sys
-import cv2
-# from cv2 import *
-from enum import Enum
 import os
-from dotenv import load_dotenv, find_dotenv
+from dotenv import load_dotenv
 from pathlib import Path
-from helper import *
-from google import genai
-from google.genai import types
-from supervisor import run_vision_model
-import serial
-
-if sys.platform.startswith('win'):
-    import msvcrt
-else:
-    import getch
-
-serial_port = '/dev/ttyACM2'
+from camera import CameraService
+from frame import Frame, FrameArchive
+from vision_client import LoopLagMonitor, lazy_backend
+from vision_cache import VisionCache, dhash
+from flame_detector import FlameDetector, parse_roi
+from scheduler import CheckScheduler
+from consensus import ConsensusSpec, vote
+from state_estimator import StateEstimator
+from rate_limiter import Dropped, Priority, VisionRateLimiter
+from resilience import CircuitBreaker, Hedger
+from fsm import MonitorSpec, StateMachine, StateSpec, Transition
+from preprocess import UploadPreprocessor
+from tracing import tracer
+from vision_result import State, VisionResult, VISION_RESPONSE_SCHEMA, parse_vision_result, parse_stats
+from lighter import LighterController
+from keyboard import KeyEvent, KeyListener
+
+serial_port = os.getenv("LIGHTER_PORT", '/dev/ttyACM2')
+supervisor_camera = 0
 
 # Get current directory
 current_directory = os.getcwd()
 images_directory = os.path.join(current_directory, "modules/supervisor/images/")
-img_name = "frame.jpg"
-img_path = os.path.join(images_directory, img_name)
 # Load the environment variables
 load_dotenv(Path(f"{current_directory}/.env"))
+# Set FRAME_ARCHIVE_DIR to keep every FRAME_ARCHIVE_EVERY-th checked frame for debugging
+FRAME_ARCHIVE_DIR = os.getenv("FRAME_ARCHIVE_DIR")
+FRAME_ARCHIVE_EVERY = int(os.getenv("FRAME_ARCHIVE_EVERY", "1"))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "90"))
+# Region around the candle wick watched by the local flame detector, "y0,x0,y1,x1" in 0-1000
+FLAME_ROI = parse_roi(os.getenv("FLAME_ROI"))
+# Uploads are cropped to the workspace UPLOAD_ROI ("y0,x0,y1,x1" in 0-1000, default:
+# the full frame), widened to cover the last returned points, and downscaled to
+# UPLOAD_LONG_SIDE. Without UPLOAD_ROI the crop follows the points alone and goes back
+# to the full frame every few uploads. UPLOAD_DUAL=1 sends a low-res full frame plus a
+# high-res crop instead.
+UPLOAD_ROI = parse_roi(os.getenv("UPLOAD_ROI"))
+UPLOAD_LONG_SIDE = int(os.getenv("UPLOAD_LONG_SIDE", "768"))
+UPLOAD_DUAL = os.getenv("UPLOAD_DUAL", "0") == "1"
+# A positive answer to a high-stakes check (candle placed, flame lit) is confirmed by
+# asking CONSENSUS_K - 1 more times in parallel, CONSENSUS_QUORUM answers must agree.
+# CONSENSUS_K=1 turns this off
+CONSENSUS_K = int(os.getenv("CONSENSUS_K", "3"))
+CONSENSUS_QUORUM = int(os.getenv("CONSENSUS_QUORUM", "2"))
+# Highest belief in a flag that drift alone reaches (see state_estimator). With a
+# consensus it stays neutral and the vote brings the second answer a flip needs,
+# without one a single answer can flip a flag that no answer has spoken against
+ESTIMATOR_MAX_PRIOR = 0.5 if CONSENSUS_K > 1 else 0.6
+# Requests the backend runs at once: a confirmation vote next to a routine check,
+# each of them possibly hedged
+VISION_MAX_IN_FLIGHT = int(os.getenv("VISION_MAX_IN_FLIGHT", str(2 * (CONSENSUS_K + 1))))
+# Quota for vision calls: a token bucket of VISION_CALLS_PER_MINUTE with bursts of
+# VISION_BURST, and at most VISION_RUN_BUDGET calls per run (0 for no limit)
+VISION_CALLS_PER_MINUTE = float(os.getenv("VISION_CALLS_PER_MINUTE", "60"))
+VISION_BURST = int(os.getenv("VISION_BURST", "6"))
+VISION_RUN_BUDGET = int(os.getenv("VISION_RUN_BUDGET", "0")) or None
+# A request slower than the rolling HEDGE_QUANTILE of answer times gets a duplicate
+# (0 turns hedging off). After BREAKER_FAILURES failed requests in a row checks use
+# the local fallbacks for BREAKER_COOLDOWN_S before the backend is tried again.
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_S = float(os.getenv("BREAKER_COOLDOWN_S", "10"))
+# Flame checks come first when the quota is tight, then checks that can move the FSM
+VISION_PRIORITY = {
+    State.LIGHT_CANDLE: Priority.SAFETY,
+    State.PLACE_CANDLE: Priority.TRANSITION,
+}
+# Cold import budget, see the README and `--import-profile`
+COLD_START_BUDGET_S = 0.3
+# Set TRACE_DIR to record spans for every supervision cycle (Perfetto JSON + JSONL)
+TRACE_DIR = os.getenv("TRACE_DIR")
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MODEL_ID = "gemini-robotics-er-1.5-preview"
@@ -47,7 +96,7 @@ PROMPT = """
           You will provide feedback to submodels that execute robot claw movement.
           There are the following states the robot claw can take:
           - IDLE = "idle"
-          - PICK_UP_CANDLE = "pick_up_candle"
+          - PLACE_CANDLE = "place_candle"
           - LIGHT_CANDLE = "light_candle"
           - RETRACT_ARM = "retract_arm"
           Objective:
@@ -58,7 +107,7 @@ PROMPT = """
         
         Return the current state, next state of the robot claw, the points, and the instructions in the json format:
           {"current_state": <current_state>,
-          {"next_state": <next_state>,
+          "next_state": <next_state>,
           "points": [{"point": <point>, "label": <label>}, ...],
           "claw_has_candle": <claw_has_candle>,
           "is_flame_lit": <is_flame_lit>,
@@ -66,40 +115,40 @@ PROMPT = """
           "is_arm_retracted": <is_arm_retracted>,
           "instructions": <instructions>}
 
-        If the image does not contain any of the objects of interest, return the current state and the next state as "IDLE", and false for all the other fields.
+        If the image does not contain any of the objects of interest, return the current state and the next state as "idle", and false for all the other fields.
         """
-client = genai.Client(api_key=GEMINI_API_KEY)
-
-def read_single_key():
-    if sys.platform.startswith('win'):
-        return msvcrt.getch().decode('utf-8')
-    else:
-        return getch.getch().decode('utf-8')
-
-async def take_picture(img_path: str):
-    # Open the default camera
-    cam = cv2.VideoCapture(0)
-    print("Camera opened")
-    print("Waiting for 2 seconds...")
-    time.sleep(2)
-    # Capture one frame
-    ret, frame = cam.read()
+# Seconds a single vision request may take before the check is given up
+VISION_DEADLINE_S = float(os.getenv("VISION_DEADLINE_S", "15"))
+# Gemini by default, VISION_BACKEND=local for the offline stand-in server
+# Built on first use, main() does that in the background during camera warm-up
+get_vision_backend = lazy_backend(PROMPT, MODEL_ID, GEMINI_API_KEY, deadline_s=VISION_DEADLINE_S,
+                                  max_in_flight=VISION_MAX_IN_FLIGHT,
+                                  response_schema=VISION_RESPONSE_SCHEMA)
+# Cameras stay open for the whole run, a check only looks up the newest frame.
+camera_service = CameraService(warmup_s=2.0, jpeg_quality=JPEG_QUALITY)
+# Every request to the vision backend goes through the limiter
+vision_limiter = VisionRateLimiter(VISION_CALLS_PER_MINUTE, VISION_BURST, VISION_RUN_BUDGET)
+vision_hedger = Hedger(quantile=HEDGE_QUANTILE)
+vision_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN_S)
+# The relay's port is opened once in main() and stays open
+lighter = LighterController(serial_port)
+# Manual override: a key press during a monitored phase
+key_listener = KeyListener()
+frame_archive: Optional[FrameArchive] = None
+
+async def take_picture() -> Frame:
+    # Grab the newest frame from the already open camera
+    with tracer.span("take_picture", camera=supervisor_camera):
+        frame = await camera_service.get_latest_frame(supervisor_camera)
     print("Frame captured")
-    # Save the frame
-    cv2.imwrite(img_path, frame)
-    # Close the camera
-    cam.release()
+    if frame_archive is not None:
+        frame_archive.submit(frame)
+    return frame
 
 # --- Mock Gemini ER1.5 Robotics API ---
 # This class simulates the robot's API, allowing us to build
 # and test the supervisor logic.
 
-class State(Enum):
-    IDLE = "idle"
-    PLACE_CANDLE = "place_candle"
-    LIGHT_CANDLE = "light_candle"
-    RETRACT_ARM = "retract_arm"
-
 class RobotAPI:
     """
     A mock class simulating the Gemini ER1.5 robotics preview API.
@@ -108,6 +157,12 @@ class RobotAPI:
     def __init__(self):
         # self.current_state = State.
         self.current_state = State.IDLE
+        # What the vision model last said should come next
+        self.next_state = State.IDLE
+        self.vision_calls = 0
+        # Clock shared with the frame timestamps, and when the FSM last moved
+        self.clock = time.monotonic
+        self.last_transition_at = self.clock()
         self._lighting_start_time: Optional[float] = None
         self.candle_is_actually_lit = False
         self.claw_has_candle = False
@@ -115,19 +170,99 @@ class RobotAPI:
         self.is_candle_in_cake = False
         self.is_arm_retracted = False
         self.instructions = ""
+        # The flags above are the estimator's decisions, not the last answer
+        self.estimator = StateEstimator(max_prior=ESTIMATOR_MAX_PRIOR)
+        # Agreement behind the last applied result, see consensus.py
+        self.agreement = 1.0
+        # Last non-empty points, [y, x] in full-frame 0-1000 coordinates
+        self.points = VisionResult().points
+        # Points of the last answer, empty ones included: the next upload is cropped around them
+        self.crop_points = VisionResult().points
+        self.labels = []
+        self.preprocessor = UploadPreprocessor(
+            roi=UPLOAD_ROI, long_side=UPLOAD_LONG_SIDE, dual=UPLOAD_DUAL,
+            jpeg_quality=JPEG_QUALITY,
+        )
+        # Static scenes (arm paused, nothing changing) reuse the last answer.
+        # The flame can appear from one frame to the next, so never cache while lighting.
+        self.vision_cache = VisionCache(
+            ttl_s=10.0,
+            ttl_by_state={State.PLACE_CANDLE: 5.0, State.LIGHT_CANDLE: 0.0},
+        )
+        # Local flame detector verdict: True/False, or None when it is unsure
+        self.flame_detector = FlameDetector(roi=FLAME_ROI)
+        self.local_flame_lit: Optional[bool] = None
+        self.local_update = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._manual_fire: Optional[asyncio.Task] = None
         print("RobotAPI initialized. State: idle")
 
-
-    def set_robot_state(self, response_json: dict):
-        if (type(response_json) != dict or response_json is None):
+    def start_flame_watch(self):
+        """Runs the local flame detector on every frame the supervisor camera captures."""
+        self._loop = asyncio.get_running_loop()
+        self.flame_detector.reset()
+        self.local_flame_lit = None
+        camera_service.add_listener(supervisor_camera, self._on_frame)
+
+    def stop_flame_watch(self):
+        camera_service.remove_listener(supervisor_camera, self._on_frame)
+        self.local_flame_lit = None
+
+    def _on_frame(self, frame: Frame):
+        # Runs in the camera reader thread
+        reading = self.flame_detector.update(frame.image)
+        if reading.lit == self.local_flame_lit:
             return
-        # self.next_state = response_json.get("next_state", State.IDLE)
-        self.current_state = response_json.get("next_state", State.IDLE)
-        self.claw_has_candle = response_json.get("claw_has_candle", False)
-        self.is_flame_lit = response_json.get("is_flame_lit", False)
-        self.is_candle_in_cake = response_json.get("is_candle_in_cake", False)
-        self.is_arm_retracted = response_json.get("is_arm_retracted", False)
-        self.instructions = response_json.get("instructions", "")
+        self.local_flame_lit = reading.lit
+        if reading.lit:
+            print(f"[Supervisor] Local detector sees a flame (area {reading.fraction:.1e}, flicker {reading.flicker:.2f})")
+        self._loop.call_soon_threadsafe(self._apply_local_flame, reading.lit, frame.timestamp)
+
+    def _apply_local_flame(self, lit: Optional[bool], at: float):
+        if lit is not None:
+            self.is_flame_lit = self.estimator.observe(
+                "is_flame_lit", lit, "flame_detector", self.current_state, at)
+        self.local_update.set()
+
+
+    def manual_light(self, event: KeyEvent) -> bool:
+        """Key press while lighting: fire the lighter and treat the candle as lit."""
+        print(f"[Keyboard] Key pressed: {event.key}. Marking candle as lit.")
+        self.is_flame_lit = self.estimator.observe(
+            "is_flame_lit", True, "keyboard", self.current_state, self.clock())
+        self._manual_fire = asyncio.create_task(lighter.fire())
+        return True
+
+    def transition(self, state: State):
+        """FSM transition. Results from frames captured before it are stale."""
+        tracer.instant("fsm.transition", source=getattr(self.current_state, "value", str(self.current_state)), target=state.value)
+        # Beliefs drift at the old state's rates up to here
+        self.estimator.advance(self.current_state, self.clock())
+        self.current_state = state
+        self.last_transition_at = self.clock()
+
+    def set_robot_state(self, result: Optional[VisionResult]):
+        if result is None:
+            return
+        with tracer.span("set_robot_state"):
+            self._apply_result(result)
+
+    def _apply_result(self, result: VisionResult):
+        # The FSM decides when to move, the model's suggestion is one of its guards
+        self.next_state = result.next_state
+        # The answer is one more observation of each flag, fused with the
+        # earlier answers, the local flame detector and the keyboard
+        # Answers without votes (cache hits, the breaker's fallback) are not new evidence
+        if result.votes:
+            flags = self.estimator.observe_result(result, self.current_state, self.clock(), count=result.votes)
+            for flag, value in flags.items():
+                setattr(self, flag, value)
+        self.instructions = result.instructions
+        self.agreement = result.agreement
+        self.crop_points = result.points
+        if len(result.points):
+            self.points = result.points
+            self.labels = result.labels
         
     async def run_model(self, model_name: str) -> bool:
         """
@@ -168,10 +303,7 @@ class RobotAPI:
                     await asyncio.sleep(interval)
 
                 print("[Robot] 'light_candle' model timed out (finished naturally).")
-                ser = serial.Serial(serial_port, 9600)  # open serial port
-                print(ser.name)         # check which port was really used
-                ser.write(b'1')     # write a string
-                ser.close()             # close port
+                await lighter.fire()
 
             elif model_name == State.RETRACT_ARM:
                 await asyncio.sleep(4)
@@ -193,40 +325,172 @@ class RobotAPI:
             if model_name == "light_candle":
                 self._lighting_start_time = None
 
-    def query_vision_model(self, img_path: str) -> dict:
-        with open(img_path, 'rb') as f:
-            image_bytes = f.read()
-        image_response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=[
-                types.Part.from_bytes(
-                    data=image_bytes,
-                    mime_type='image/jpeg',
-                ),
-                PROMPT
-            ],
-            config = types.GenerateContentConfig(
-                temperature=0.5,
-                thinking_config=types.ThinkingConfig(thinking_budget=0),
-            )
-        )
-        return json_repair.loads(image_response.text)
-
+    async def take_picture(self) -> Frame:
+        return await take_picture()
+
+    async def query_vision_model(self, frame: Frame, temperature: Optional[float] = None,
+                                 use_cache: bool = True) -> Optional[VisionResult]:
+        with tracer.span("query_vision_model", state=getattr(self.current_state, "value", None)):
+            return await self._query_vision_model(frame, temperature, use_cache)
+
+    async def _query_vision_model(self, frame: Frame, temperature: Optional[float],
+                                  use_cache: bool) -> Optional[VisionResult]:
+        # Image work runs off the event loop, so key presses and local
+        # detector updates are not held up by it
+        with tracer.span("dhash"):
+            frame_hash = await asyncio.to_thread(dhash, frame.image)
+        cached = self.vision_cache.lookup(frame_hash, self.current_state, frame.timestamp) if use_cache else None
+        if cached is not None:
+            print(f"[Supervisor] Scene unchanged, reusing cached result {self.vision_cache.stats()}")
+            # Already counted as evidence when it was fresh
+            return dataclasses.replace(cached, votes=0)
+        if not vision_breaker.allow():
+            return self.fallback_result()
+        try:
+            return await self._query_backend(frame, frame_hash, temperature)
+        except asyncio.CancelledError:
+            vision_breaker.release()
+            raise
 
-    async def picture_and_run_vision_model(self, use_api: bool = True) -> dict:
-        # Open the default camera
-        await take_picture(img_path)
+    async def _query_backend(self, frame: Frame, frame_hash: int,
+                             temperature: Optional[float]) -> Optional[VisionResult]:
+        vision_backend = get_vision_backend()
+        priority = VISION_PRIORITY.get(self.current_state, Priority.ROUTINE)
+        try:
+            with tracer.span("vision.rate_limit", priority=priority.name.lower(),
+                             queue=vision_limiter.queue_depth):
+                waited = await vision_limiter.acquire(priority, vision_backend.deadline_s)
+        except Dropped:
+            vision_breaker.release()
+            return None
+        # Only upload the workspace, at the resolution the model needs
+        with tracer.span("preprocess"):
+            upload = await asyncio.to_thread(self.preprocessor.prepare, frame, self.crop_points)
+        started = self.clock()
+        # Time spent in the queue counts against the request's deadline
+        deadline_s = vision_backend.deadline_s - waited
+
+        def ask(deadline_s: float):
+            return vision_backend.query(upload.images, deadline_s=deadline_s, temperature=temperature,
+                                        prompt_hint=upload.prompt_hint)
+
+        async def duplicate():
+            # The duplicate pays for its own token and has what is left of the deadline
+            remaining = deadline_s - (self.clock() - started)
+            remaining -= await vision_limiter.acquire(priority, remaining)
+            return await ask(remaining)
+
+        # Awaiting the async client keeps the event loop (and the running
+        # model's progress ticks) going, and a cancelled monitor aborts the request.
+        try:
+            with tracer.span("vision.upload_and_wait", bytes=upload.bytes_total):
+                response_text = await vision_hedger.run(lambda: ask(deadline_s), duplicate)
+        except asyncio.TimeoutError:
+            print(f"[Supervisor] Vision model missed its {vision_backend.deadline_s:.0f}s deadline.")
+            vision_breaker.record_failure("timeout")
+            return None
+        except Exception as e:
+            print(f"[Supervisor] Vision model request failed: {e!r}")
+            vision_breaker.record_failure(type(e).__name__)
+            return None
+        vision_limiter.record_latency(self.clock() - started)
+        print(f"[Vision] Uploaded {upload.bytes_total / 1024:.0f} KB {upload.sizes}, "
+              f"answer in {(self.clock() - started) * 1000:.0f} ms"
+              + (f" after {waited * 1000:.0f} ms in the queue" if waited > 0.001 else ""))
+        with tracer.span("parse"):
+            result = parse_vision_result(response_text)
+        print(f"[Vision] Parsed in {parse_stats.last_s * 1000:.2f} ms {parse_stats}")
+        if result is None:
+            vision_breaker.record_failure("unparsable answer")
+            return None
+        vision_breaker.record_success()
+        # Points come back relative to the crop, map them onto the full frame
+        upload.map_points(result)
+        self.vision_cache.store(frame_hash, self.current_state, result, frame.timestamp)
+        return result
+
+
+    def fallback_result(self) -> Optional[VisionResult]:
+        """
+        Answer while the circuit breaker keeps the backend out: the local flame
+        detector's verdict if it has one, otherwise no answer. It carries no
+        votes, so the estimator does not count it as vision evidence.
+        """
+        if self.local_flame_lit is None:
+            return None
+        lit = self.local_flame_lit
+        print(f"[Supervisor] Vision backend unavailable, local detector says lit={lit}")
+        return VisionResult(current_state=self.current_state,
+                            next_state=State.RETRACT_ARM if lit else self.current_state,
+                            is_candle_in_cake=True, is_flame_lit=lit, votes=0)
+
+    async def analyze_frame(self, frame: Frame, use_api: bool = True, temperature: Optional[float] = None,
+                            use_cache: bool = True) -> Optional[VisionResult]:
+        """Runs the vision model on a frame without touching the robot state."""
         # Run the vision model
-        # response_json = run_vision_model(img_path)
-        # Set the robot state
+        # result = run_vision_model(frame)
         if use_api:
-            response_json = self.query_vision_model(img_path)
-            # response_json = run_vision_model(img_path)
-            self.set_robot_state(response_json)
+            self.vision_calls += 1
+            result = await self.query_vision_model(frame, temperature, use_cache)
+            # result = await run_vision_model(frame)
         else:
-            response_json = {"current_state": State.IDLE, "next_state": State.LIGHT_CANDLE, "points": [], "claw_has_candle": False, "is_flame_lit": False, "is_candle_in_cake": True, "is_arm_retracted": False, "instructions": ""}
-        print(f"[Supervisor] Response JSON: {response_json}")
-        return response_json
+            result = VisionResult(next_state=State.LIGHT_CANDLE, is_candle_in_cake=True)
+        print(f"[Supervisor] Vision result: {result}")
+        return result
+
+    async def analyze_consensus(self, frame: Frame, consensus: ConsensusSpec,
+                                first: Optional[VisionResult] = None) -> Optional[VisionResult]:
+        """
+        Asks `consensus.k` times in parallel, starting with `frame` and then on
+        the frames that follow it. `first` is an answer already received for
+        `frame`: it is the first vote and only k - 1 requests are sent.
+        Returns the agreed result, or None without a quorum so that a single
+        odd answer cannot move the FSM.
+        """
+        started = self.clock()
+        requests = []
+        if first is not None:
+            answered = asyncio.get_running_loop().create_future()
+            answered.set_result(first)
+            requests.append(answered)
+        try:
+            with tracer.span("vision.consensus", k=consensus.k, quorum=consensus.quorum):
+                for i in range(len(requests), consensus.k):
+                    if i:
+                        await asyncio.sleep(consensus.frame_spacing_s)
+                        frame = await self.take_picture()
+                    # Every request must see the model, a cached answer would vote twice
+                    requests.append(asyncio.create_task(self.analyze_frame(
+                        frame, temperature=consensus.temperature(i), use_cache=False)))
+                outcome = await vote(requests, consensus.quorum, consensus.key)
+        finally:
+            for request in requests:
+                request.cancel()
+        print(f"[Consensus] {outcome} in {(self.clock() - started) * 1000:.0f} ms")
+        if not outcome.reached:
+            return None
+        # A copy, the answer may also sit in the cache. A fallback winner is
+        # still no vision evidence, whatever agreed with it
+        votes = outcome.votes if outcome.result.votes else 0
+        return dataclasses.replace(outcome.result, agreement=outcome.agreement, votes=votes)
+
+    async def picture_and_run_vision_model(self, use_api: bool = True,
+                                           consensus: Optional[ConsensusSpec] = None) -> Optional[VisionResult]:
+        if use_api and vision_breaker.unavailable:
+            # Backend is down: no answer, so the caller backs off instead of
+            # matching its guards against the state of the last real one
+            print("[Supervisor] Vision backend unavailable, no answer.")
+            return None
+        # Grab the newest frame, it stays in memory all the way to the upload
+        frame = await self.take_picture()
+        if use_api and consensus is not None and consensus.k > 1:
+            result = await self.analyze_consensus(frame, consensus)
+        else:
+            result = await self.analyze_frame(frame, use_api)
+        # Set the robot state
+        if use_api:
+            self.set_robot_state(result)
+        return result
 
 # --- Supervisor Logic ---
 
@@ -234,130 +498,298 @@ async def monitor_general(
     robot: RobotAPI, 
     main_task: asyncio.Task, 
     check_interval: float = 5.0,
-    function_to_check: callable=lambda x: x.is_candle_in_cake
+    function_to_check: callable=lambda x: x.is_candle_in_cake,
+    local_check: Optional[callable] = None,
+    scheduler: Optional[CheckScheduler] = None,
+    max_in_flight: int = 2,
+    min_interval: float = 0.0,
+    keys: Optional[asyncio.Queue] = None,
+    on_key: Optional[callable] = None,
+    consensus: Optional[ConsensusSpec] = None
 ):
     """
     Concurrent supervision task.
     Periodically checks the camera to see if the candle has been placed.
     Cancels the main task early if success is detected.
+    Checks are pipelined: a new frame is sent every `check_interval` even while
+    up to `max_in_flight` earlier requests are still waiting for an answer.
+    A result is only applied if its frame is newer than the last applied one
+    and than the last FSM transition.
+    If `local_check` is given it returns the on-device verdict (True/False, or
+    None when unsure); the monitor wakes up as soon as that verdict changes and
+    only asks the vision model when it is None.
+    If `scheduler` is given it picks the interval after every applied result,
+    starting from `check_interval`. Checks are never launched closer together
+    than `min_interval`.
+    If `keys` is given, every KeyEvent from it is passed to `on_key`, which
+    returns True to stop the main task right away (manual override).
+    If `consensus` is given, the first check is a parallel vote (see
+    RobotAPI.analyze_consensus), since after the first interval the event may
+    well have happened already. Later checks are single calls, and one whose
+    answer is positive on `consensus.key` is not applied as is: a vote with
+    that answer as its first ballot confirms or rejects it first. No new
+    checks start while a vote runs. Only an agreed result can stop the task.
+    If the task finishes on its own, the checks still in flight are awaited
+    and applied (see _settle_checks), so a success they saw is not lost.
     """
     print(f"[Supervisor] Monitor started. Checking every {check_interval:.1f}s.")
+    loop = asyncio.get_running_loop()
+    # check task -> (frame, launch time)
+    in_flight = {}
+    # Checks in in_flight that are consensus votes
+    confirming = set()
+    voting = consensus is not None and consensus.k > 1
+    last_applied = -math.inf
+    last_launch = loop.time()
 
     try:
         while not main_task.done():
-            # Wait for either the interval to elapse or the task to finish early
+            now = loop.time()
+            if now >= last_launch + check_interval and len(in_flight) < max_in_flight and not confirming:
+                last_launch = now
+                if local_check is not None and local_check(robot) is not None:
+                    print("[Supervisor] Local detector is confident, skipping the vision model.")
+                else:
+                    print("[Supervisor] Checking camera for candle...")
+                    frame = await robot.take_picture()
+                    if voting and last_applied == -math.inf and not in_flight:
+                        check = asyncio.create_task(robot.analyze_consensus(frame, consensus))
+                        confirming.add(check)
+                    else:
+                        check = asyncio.create_task(robot.analyze_frame(frame))
+                    in_flight[check] = (frame, now)
+
+            # Wait for the next launch slot, an answer, the task to finish early,
+            # or the local detector to change its verdict
+            waiters = [main_task, *in_flight]
+            wake = None
+            if local_check is not None:
+                wake = asyncio.create_task(robot.local_update.wait())
+                waiters.append(wake)
+            key_wait = None
+            if keys is not None:
+                key_wait = asyncio.create_task(keys.get())
+                waiters.append(key_wait)
+            timeout = None
+            if len(in_flight) < max_in_flight and not confirming:
+                timeout = max(0.0, last_launch + check_interval - loop.time())
             done, _ = await asyncio.wait(
-                [main_task],
-                timeout=check_interval
+                waiters,
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED
             )
-            if done:  # main task completed early
+            if wake is not None:
+                wake.cancel()
+            if key_wait is not None and key_wait not in done:
+                key_wait.cancel()
+            if main_task in done:  # main task completed early
+                if in_flight:
+                    # Answers on their way say whether the model succeeded, without
+                    # them a phase that did would run again
+                    print("[Supervisor] Model finished, waiting for the checks in flight.")
+                    await _settle_checks(robot, in_flight, confirming, consensus if voting else None,
+                                         function_to_check, last_applied, VISION_DEADLINE_S)
                 break
 
-            print("[Supervisor] Checking camera for candle...")
-            result = await robot.picture_and_run_vision_model()
-            robot.set_robot_state(result)
-            if function_to_check(robot):
+            if key_wait in done and on_key(robot, key_wait.result()):
+                tracer.instant("monitor.cancel_main_task", reason="key")
+                main_task.cancel()
+                latency = time.perf_counter() - key_wait.result().received_at
+                print(f"[Keyboard] Cancelled the model {latency * 1000:.2f} ms after the key press.")
+                break
+
+            if local_check is not None and robot.local_update.is_set():
+                robot.local_update.clear()
+                if local_check(robot) is not None and function_to_check(robot):
+                    print("[Supervisor] ✅ Success (local detector), stopping main task.")
+                    tracer.instant("monitor.cancel_main_task")
+                    main_task.cancel()
+                    break
+
+            success = False
+            for check in [t for t in in_flight if t in done]:
+                frame, launched_at = in_flight.pop(check)
+                captured_at = frame.timestamp
+                confirmation = check in confirming
+                confirming.discard(check)
+                result = check.result()
+                if captured_at <= last_applied or captured_at <= robot.last_transition_at:
+                    print("[Supervisor] Dropping stale result.")
+                    continue
+                if confirming and not confirmation:
+                    # The running vote looks at newer frames than this answer
+                    continue
+                if voting and not confirmation and result is not None and consensus.key(result):
+                    # One positive answer is not enough to stop the model, have it confirmed
+                    print("[Supervisor] Positive answer, asking for a consensus to confirm it.")
+                    for other in [t for t in in_flight if not t.done()]:
+                        other.cancel()
+                        del in_flight[other]
+                    confirm = asyncio.create_task(robot.analyze_consensus(frame, consensus, first=result))
+                    in_flight[confirm] = (frame, loop.time())
+                    confirming.add(confirm)
+                    continue
+                last_applied = captured_at
+                robot.set_robot_state(result)
+                if scheduler is not None:
+                    scheduler.record_latency(loop.time() - launched_at)
+                    check_interval = max(min_interval, scheduler.next_interval(result))
+                if function_to_check(robot):
+                    success = True
+                    break
+                else:
+                    print("[Supervisor] ❌ Not success, continuing...")
+            if success:
                 print("[Supervisor] ✅ Success, stopping main task.")
+                tracer.instant("monitor.cancel_main_task")
                 main_task.cancel()
                 break
-            else:
-                print("[Supervisor] ❌ Not success, continuing...")
 
     except asyncio.CancelledError:
         print("[Supervisor] Monitor was cancelled.")
         raise
 
     finally:
+        # Answers still in flight are no longer needed
+        for check in in_flight:
+            check.cancel()
         print("[Supervisor] Monitor stopped.")
 
 
-async def main():
+async def _settle_checks(robot: RobotAPI, in_flight: dict, confirming: set,
+                         consensus: Optional[ConsensusSpec], function_to_check: callable,
+                         last_applied: float, timeout: float):
     """
-    The main Robotics Supervisor orchestration logic.
+    Applies the answers of the checks still in flight once the model finished
+    on its own, waiting at most `timeout` for them. As in monitor_general, a
+    positive single answer is confirmed by a vote first if `consensus` is
+    given. Stops as soon as `function_to_check` holds.
     """
-    robot = RobotAPI()
-
-    # TODO: Implement the FSM
-    robot.current_state = State.PLACE_CANDLE
-    is_first_time = True
-    while True:
-    # INSERT_YOUR_CODE
-        # Finite State Machine for Supervising the Candle Task
-        # States: IDLE -> PLACE_CANDLE -> VERIFY_PLACEMENT -> LIGHT_CANDLE -> RETRACT_ARM
-        if is_first_time:
-            print('back in main loop', robot.current_state)
-        if robot.current_state == State.IDLE:
-            response_json = await robot.picture_and_run_vision_model()
-            if response_json is None or type(response_json) != dict or response_json.get("next_state") == State.IDLE:
-                print("--- SUPERVISOR: No objects of interest found. ---")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while in_flight:
+        done, _ = await asyncio.wait(in_flight, timeout=max(0.0, deadline - loop.time()),
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            print("[Supervisor] Checks in flight did not answer in time.")
+            return
+        for check in done:
+            frame, _ = in_flight.pop(check)
+            confirmation = check in confirming
+            confirming.discard(check)
+            result = check.result()
+            if result is None or frame.timestamp <= last_applied or frame.timestamp <= robot.last_transition_at:
                 continue
-            robot.set_robot_state(response_json)
-            await asyncio.sleep(5)
-            if robot.current_state != State.IDLE:
-                is_first_time = True
-                print("[Supervisor][FSM] Proceeding to place the candle.")
-            
-        elif robot.current_state == State.PLACE_CANDLE:
-            if is_first_time:
-                place_candle_task = asyncio.create_task(robot.run_model(State.PLACE_CANDLE))
-                # 2. Create the concurrent monitoring task.
-                #    We pass it a reference to the 'light_candle_task' so it can cancel it.
-                # monitor_place_candle_task = asyncio.create_task(monitor_place_candle(robot, place_candle_task, check_interval=5.0))
-                monitor_place_candle_task = asyncio.create_task(monitor_general(robot, place_candle_task, check_interval=5.0, function_to_check=lambda x: x.is_candle_in_cake))
-
-                # 3. Wait for the monitoring task to complete.
-                #    The monitor will exit when EITHER the candle is lit
-                #    OR the 'place_candle' task finishes on its own.
-                await monitor_place_candle_task
-                    
-                # 4. We must also 'await' the main task.
-                #    - If it was cancelled, this will raise asyncio.CancelledError.
-                #    - If it finished normally (timed out), this will return its result.
-                #    This is crucial for proper exception handling.
-                is_first_time = False
-            try:
-                await place_candle_task
-            except asyncio.CancelledError:
-                print("[Supervisor][FSM] 'place_candle_task' was cancelled due to interrupt or success.")
-                robot.current_state = State.LIGHT_CANDLE
-                is_first_time = True
-                print("[Supervisor][FSM] Place candle process complete.")
-            if robot.is_candle_in_cake:
-                robot.current_state = State.LIGHT_CANDLE
-                is_first_time = True
-                print("[Supervisor][FSM] Candle is in the cake. Proceeding to light the candle.")
-
-        elif robot.current_state == State.LIGHT_CANDLE:
-            if is_first_time:
-                light_candle_task = asyncio.create_task(robot.run_model(State.LIGHT_CANDLE))
-                # monitor_task = asyncio.create_task(monitor_candle_lighting(robot, light_candle_task))
-                monitor_task = asyncio.create_task(monitor_general(robot, light_candle_task, check_interval=5.0, function_to_check=lambda x: x.is_flame_lit))
-                await monitor_task
-                is_first_time = False
-            try:
-                await light_candle_task
-            except asyncio.CancelledError:
-                print("[Supervisor][FSM] 'light_candle_task' was cancelled due to interrupt or success.")
-                print("[Supervisor][FSM] Candle light process complete.")
-                robot.current_state = State.RETRACT_ARM
-                is_first_time = True
-                print("[Supervisor][FSM] Candle is lit. Proceeding to retract the arm.")
-            if robot.is_flame_lit:
-                robot.current_state = State.RETRACT_ARM
-                is_first_time = True
-                print("[Supervisor][FSM] Candle is lit. Proceeding to retract the arm.")
-
-        elif robot.current_state == State.RETRACT_ARM:
-            print("\n[Supervisor][FSM] State: RETRACT_ARM")
-            await robot.run_model("retract_arm")
-            print("[Supervisor][FSM] RETRACT_ARM complete. Mission accomplished!")
-            break
-
-        else:
-            print(f"[Supervisor][FSM] Unknown state: {robot.current_state}")
-            break
-    # end TODO
+            if confirming and not confirmation:
+                continue
+            if consensus is not None and not confirmation and consensus.key(result):
+                print("[Supervisor] Positive answer, asking for a consensus to confirm it.")
+                confirm = asyncio.create_task(robot.analyze_consensus(frame, consensus, first=result))
+                in_flight[confirm] = (frame, loop.time())
+                confirming.add(confirm)
+                continue
+            last_applied = frame.timestamp
+            robot.set_robot_state(result)
+            if function_to_check(robot):
+                print("[Supervisor] ✅ Success, seen in an answer that came after the model finished.")
+                return
+
+
+# The candle mission as a transition table, run by fsm.StateMachine
+CANDLE_MISSION = {
+    State.IDLE: StateSpec(
+        transitions=[
+            Transition(State.PLACE_CANDLE, lambda r: r.next_state == State.PLACE_CANDLE, "model says place the candle"),
+            Transition(State.LIGHT_CANDLE, lambda r: r.next_state == State.LIGHT_CANDLE, "model says light the candle"),
+            Transition(State.RETRACT_ARM, lambda r: r.next_state == State.RETRACT_ARM, "model says retract the arm"),
+        ],
+        max_calls_per_minute=6.0,
+    ),
+    State.PLACE_CANDLE: StateSpec(
+        action=lambda r: r.run_model(State.PLACE_CANDLE),
+        monitor=MonitorSpec(
+            success=lambda r: r.is_candle_in_cake,
+            scheduler=lambda: CheckScheduler("place_candle", ("claw",), ("cake",), tool_exclude=("lighter",), latency_budget_s=8.0),
+            consensus=ConsensusSpec(CONSENSUS_K, CONSENSUS_QUORUM, key=lambda r: r.is_candle_in_cake),
+        ),
+        transitions=[Transition(State.LIGHT_CANDLE, lambda r: r.is_candle_in_cake, "candle is in the cake")],
+        timeout_s=120.0,
+        fallback=State.IDLE,
+        max_calls_per_minute=40.0,
+    ),
+    State.LIGHT_CANDLE: StateSpec(
+        action=lambda r: r.run_model(State.LIGHT_CANDLE),
+        on_enter=lambda r: r.start_flame_watch(),
+        on_exit=lambda r: r.stop_flame_watch(),
+        monitor=MonitorSpec(
+            success=lambda r: r.is_flame_lit,
+            local_check=lambda r: r.local_flame_lit,
+            on_key=lambda r, event: r.manual_light(event),
+            scheduler=lambda: CheckScheduler("light_candle", ("lighter",), ("candle",), latency_budget_s=6.0),
+            consensus=ConsensusSpec(CONSENSUS_K, CONSENSUS_QUORUM, key=lambda r: r.is_flame_lit),
+        ),
+        transitions=[Transition(State.RETRACT_ARM, lambda r: r.is_flame_lit, "candle is lit")],
+        timeout_s=120.0,
+        fallback=State.IDLE,
+        max_calls_per_minute=40.0,
+    ),
+    State.RETRACT_ARM: StateSpec(
+        action=lambda r: r.run_model(State.RETRACT_ARM),
+        transitions=[Transition(None, lambda r: True, "arm retracted, mission accomplished")],
+        max_attempts=1,
+    ),
+}
+
+
+async def main(robot: Optional[RobotAPI] = None):
+    """
+    The main Robotics Supervisor orchestration logic.
+    Pass a `robot` to drive a simulated one (see benchmark.py); the camera,
+    frame archive and loop lag monitor are only started for the real robot.
+    """
+    global frame_archive
+    hardware = robot is None
+    if hardware:
+        tracer.configure(TRACE_DIR)
+        robot = RobotAPI()
+        loop_lag = LoopLagMonitor()
+        loop_lag.start()
+        if FRAME_ARCHIVE_DIR:
+            frame_archive = FrameArchive(FRAME_ARCHIVE_DIR, every_n=FRAME_ARCHIVE_EVERY)
+        # Open the camera now so it is warm by the first check
+        camera_service.start(supervisor_camera)
+        # Import google-genai and build the client off the loop, in parallel
+        # with the camera and relay warm-up
+        backend_ready = asyncio.create_task(asyncio.to_thread(get_vision_backend))
+        # Open the relay port once, so the board's reset on open is out of the way
+        await lighter.connect()
+        key_listener.start()
+        await backend_ready
+
+    machine = StateMachine(robot, CANDLE_MISSION, monitor_general,
+                           keys=key_listener if hardware else None)
+    try:
+        await machine.run(State.PLACE_CANDLE)
+    finally:
+        if hardware:
+            # Give the terminal back even if the mission fails
+            key_listener.stop()
+
+    if hardware:
+        if frame_archive is not None:
+            await frame_archive.close()
+        await loop_lag.stop()
+        camera_service.stop()
+        print(f"[Lighter] {lighter.stats()}")
+        print(f"[RateLimiter] {vision_limiter.stats()}")
+        print(f"[Hedge] {vision_hedger.stats()}")
+        print(f"[Breaker] {vision_breaker.stats()}")
+        await lighter.close()
+        tracer.flush()
 
 if __name__ == "__main__":
+    if "--import-profile" in sys.argv:
+        from import_profile import profile
+        sys.exit(0 if profile("async_supervisor", COLD_START_BUDGET_S) else 1)
     print("Starting Robotics Supervisor Program...")
     asyncio.run(main())
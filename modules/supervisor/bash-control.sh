@@ -1,26 +1,71 @@
 
 #!/usr/bin/env bash
 
-# initial command to start with
-# cmd="just run-candle-act"
-cmd = "echo 'Hello, World!'"
+# decide_next picks the phase, the policy host runs it: both policies stay
+# loaded in one process and a phase change is a line on the host's stdin
+# instead of a new lerobot process per phase.
+DECIDE_INTERVAL_S="${DECIDE_INTERVAL_S:-5}"
 
-while true; do
-    echo ">>> Running: $cmd"
-    eval "$cmd"
+# decide_next runs as a resident service, each iteration only asks it for the next phase
+export DECIDE_SOCKET="${DECIDE_SOCKET:-/tmp/decide_next.sock}"
+pids=()
+cleanup() {
+    # Hold the arm and let the host disconnect the robot
+    if [[ -n "$host_pid" ]]; then
+        echo "quit" >&3
+        exec 3>&-
+        wait "$host_pid"
+    fi
+    [[ ${#pids[@]} -gt 0 ]] && kill "${pids[@]}" 2>/dev/null
+    rm -f "$POLICY_FIFO"
+}
+trap cleanup EXIT
 
-    echo ">>> Getting next command from Python..."
-    next_cmd=$(uv run decide_next.py "$cmd")
+# A socket left behind by a crashed service exists but refuses connections
+if ! python3 decide_client.py --ping; then
+    rm -f "$DECIDE_SOCKET"
+    echo ">>> Starting decide_next service on $DECIDE_SOCKET"
+    uv run decide_next.py --serve "$DECIDE_SOCKET" &
+    decide_pid=$!
+    pids+=("$decide_pid")
+    until python3 decide_client.py --ping; do
+        if ! kill -0 "$decide_pid" 2>/dev/null; then
+            echo ">>> decide_next service failed to start."
+            exit 1
+        fi
+        sleep 0.2
+    done
+fi
+
+# The policy host reads phase names (candle, lighter, idle, quit) from this fifo
+POLICY_FIFO="${POLICY_FIFO:-/tmp/policy_host.fifo}"
+rm -f "$POLICY_FIFO"
+mkfifo "$POLICY_FIFO"
+echo ">>> Starting policy host"
+just host-policies < "$POLICY_FIFO" &
+host_pid=$!
+exec 3>"$POLICY_FIFO"
+
+phase="idle"
+while true; do
+    echo ">>> Getting next phase from Python..."
+    next_phase=$(python3 decide_client.py "$phase")
 
     # print what Python returned
-    echo ">>> Python suggests: $next_cmd"
+    echo ">>> Python suggests: $next_phase"
 
     # check if Python says to stop or returns nothing
-    if [[ -z "$next_cmd" || "$next_cmd" == "STOP" ]]; then
+    if [[ -z "$next_phase" || "$next_phase" == "STOP" ]]; then
         echo ">>> Stopping loop."
+        echo "idle" >&3
         break
     fi
-    eval "rm -r /home/seeed/.cache/huggingface/lerobot/outputs/eval_so101_candle"
-    # set up for next iteration
-    cmd="$next_cmd"
+
+    if [[ "$next_phase" != "$phase" ]]; then
+        echo ">>> Switching to: $next_phase"
+        echo "$next_phase" >&3
+        phase="$next_phase"
+    fi
+    # let the policy work before looking again
+    sleep "$DECIDE_INTERVAL_S"
 done
@@ -0,0 +1,376 @@
+"""
+Reaction-time benchmark for the supervisor FSM.
+
+Runs `async_supervisor.main` against a simulated robot many times on a
+virtual clock, so hundreds of missions take seconds. Each mission follows a
+scripted ground truth (the candle is in the cake `--placed-at` seconds after
+'place_candle' starts, the flame is lit `--lit-at` seconds after
+'light_candle' starts). Only the models, the camera and the vision backend
+are simulated: every check goes through the real cache, rate limiter, circuit
+breaker, hedger and upload preprocessing, and the backend answers after a
+latency drawn from `--latency`. Reports percentiles of detection-to-cancel
+latency, detection-to-exit latency (until the FSM leaves the phase, also
+when its model finished on its own), backend requests and mission time.
+
+    python benchmark.py --runs 500 --latency lognormal:1.5,0.4
+    python benchmark.py --runs 500 --json > before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import selectors
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+import async_supervisor
+from async_supervisor import RobotAPI
+from frame import Frame
+from rate_limiter import VisionRateLimiter
+from resilience import CircuitBreaker, Hedger
+from standin_server import parse_latency
+from vision_client import BoundedBackend
+from vision_result import State
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose clock jumps straight to the next timer instead of
+    sleeping, so simulated seconds cost no wall time. Work handed to threads
+    (asyncio.to_thread) takes no simulated time: while any is running the
+    loop waits for it for real and the clock stands still.
+    """
+    def __init__(self):
+        super().__init__(selectors.DefaultSelector())
+        self._now = 0.0
+        self._in_executor = 0
+        select = self._selector.select
+
+        def virtual_select(timeout=None):
+            if self._in_executor and timeout != 0:
+                return select(None)
+            events = select(0)
+            if events or timeout == 0:
+                return events
+            if timeout is None:
+                raise RuntimeError("Simulation deadlocked: nothing is scheduled")
+            self._now += timeout
+            return events
+
+        self._selector.select = virtual_select
+
+    def time(self) -> float:
+        return self._now
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self._in_executor += 1
+
+        def finished(_):
+            self._in_executor -= 1
+
+        future.add_done_callback(finished)
+        return future
+
+
+@dataclass
+class Scenario:
+    # Seconds after each model starts until it would finish on its own
+    durations: Dict[State, float] = field(default_factory=lambda: {
+        State.PLACE_CANDLE: 10.0, State.LIGHT_CANDLE: 10.0, State.RETRACT_ARM: 4.0,
+    })
+    # Ground truth: seconds after the phase's model starts
+    placed_at: float = 3.2
+    lit_at: float = 6.8
+    latency: str = "lognormal:1.5,0.4"
+    # Chance the model misses an event that has already happened
+    miss_rate: float = 0.0
+    # Chance the model reports the current phase's event before it happened
+    false_rate: float = 0.0
+    # Time a cancelled model needs to stop safely
+    stop_s: float = 1.0
+
+
+# Tool and target of each phase, as labelled in the model's points
+PHASE_OBJECTS = {
+    State.PLACE_CANDLE: ("claw", "cake"),
+    State.LIGHT_CANDLE: ("lighter", "candle"),
+}
+
+
+def scene_image(placed: bool, lit: bool, progress: float, moving: bool,
+                rng: random.Random) -> np.ndarray:
+    """
+    Simulated camera frame. The ground truth is painted into every pixel, so
+    it survives cropping, scaling and JPEG: blue is the candle in the cake,
+    green the flame, red how close the phase's tool is to its target (0-1).
+    While the arm moves every frame gets fresh noise, so only a still scene
+    hashes the same twice.
+    """
+    image = np.empty((96, 128, 3), dtype=np.float32)
+    image[..., 0] = 20 + 200 * placed
+    image[..., 1] = 20 + 200 * lit
+    image[..., 2] = 20 + 200 * min(1.0, max(0.0, progress))
+    if moving:
+        noise = np.random.default_rng(rng.getrandbits(32)).uniform(-10, 10, image.shape)
+        image += noise.astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def read_scene(jpeg: bytes):
+    """(placed, lit, progress) painted into an uploaded image by scene_image."""
+    image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    blue, green, red = image.reshape(-1, 3).mean(axis=0)
+    return bool(blue > 120), bool(green > 120), min(1.0, max(0.0, float(red - 20) / 200))
+
+
+class SimBackend(BoundedBackend):
+    """
+    Vision backend that answers from the uploaded image after a simulated
+    latency, with the same deadlines and request slots as the real ones.
+    """
+    def __init__(self, robot: "SimRobotAPI", scenario: Scenario, rng: random.Random, **kwargs):
+        super().__init__("", **kwargs)
+        self.robot = robot
+        self.scenario = scenario
+        self.rng = rng
+        self.latency = parse_latency(scenario.latency, rng)
+        self.requests = 0
+
+    async def _request(self, images: List[bytes], temperature: float, prompt: str) -> str:
+        self.requests += 1
+        await asyncio.sleep(self.latency())
+        placed, lit, progress = read_scene(images[-1])
+        state = self.robot.current_state
+        if self.rng.random() < self.scenario.miss_rate:
+            placed = lit = False
+        elif self.rng.random() < self.scenario.false_rate:
+            # Claims the phase's event before it happened
+            placed = placed or state == State.PLACE_CANDLE
+            lit = lit or state == State.LIGHT_CANDLE
+        if lit:
+            next_state = State.RETRACT_ARM
+        elif placed:
+            next_state = State.LIGHT_CANDLE
+        elif state == State.IDLE:
+            # The cake and the candle are in view, so the mission can start
+            next_state = State.PLACE_CANDLE
+        else:
+            next_state = state
+        points = []
+        if state in PHASE_OBJECTS:
+            tool, target = PHASE_OBJECTS[state]
+            # The tool closes in on the target as the phase's event approaches
+            distance = 400 * (1.0 - progress)
+            points = [{"point": [500, 500], "label": target},
+                      {"point": [500, int(500 + distance)], "label": tool}]
+        return json.dumps({
+            "current_state": state.value, "next_state": next_state.value, "points": points,
+            "claw_has_candle": state == State.PLACE_CANDLE and not placed,
+            "is_flame_lit": lit, "is_candle_in_cake": placed or lit,
+            "is_arm_retracted": False, "instructions": "",
+        })
+
+
+class SimRobotAPI(RobotAPI):
+    """RobotAPI with simulated models and camera; vision goes through the real path."""
+    def __init__(self, scenario: Scenario, rng: random.Random):
+        super().__init__()
+        # Frame timestamps, transitions and the monitor all share the loop clock
+        self.clock = asyncio.get_running_loop().time
+        self.last_transition_at = self.clock()
+        self.scenario = scenario
+        self.rng = rng
+        # The simulated model answers in full-frame coordinates, so it has to see the full frame
+        self.preprocessor.follow_points = False
+        # When each event really happened, when its model was cancelled and when the FSM left it
+        self.happened_at: Dict[State, float] = {}
+        self.cancelled_at: Dict[State, float] = {}
+        self.left_at: Dict[State, float] = {}
+        self.runs: Dict[State, int] = {}
+        self.phase_started_at: Optional[float] = None
+
+    def start_flame_watch(self):
+        self.local_flame_lit = None
+
+    def stop_flame_watch(self):
+        self.local_flame_lit = None
+
+    async def take_picture(self) -> Frame:
+        now = self.clock()
+        progress = 0.0
+        event_at = self.happened_at.get(self.current_state)
+        if event_at is not None and self.phase_started_at is not None:
+            progress = (now - self.phase_started_at) / max(1e-6, event_at - self.phase_started_at)
+        image = scene_image(self._truth(State.PLACE_CANDLE, now), self._truth(State.LIGHT_CANDLE, now),
+                            progress, self.phase_started_at is not None, self.rng)
+        return Frame(image, now, async_supervisor.supervisor_camera)
+
+    def transition(self, state: State):
+        self.left_at[self.current_state] = self.clock()
+        super().transition(state)
+
+    def _truth(self, state: State, at: float) -> bool:
+        happened = self.happened_at.get(state)
+        return happened is not None and at >= happened
+
+    async def run_model(self, model_name) -> bool:
+        state = State(model_name)
+        started = self.clock()
+        self.runs[state] = self.runs.get(state, 0) + 1
+        event_at = {State.PLACE_CANDLE: self.scenario.placed_at,
+                    State.LIGHT_CANDLE: self.scenario.lit_at}.get(state)
+        if event_at is not None:
+            # A rerun of the phase does not undo what already happened
+            self.happened_at.setdefault(state, started + event_at)
+        self.phase_started_at = started
+        try:
+            await asyncio.sleep(self.scenario.durations[state])
+            return True
+        except asyncio.CancelledError:
+            self.cancelled_at[state] = self.clock()
+            await asyncio.sleep(self.scenario.stop_s)
+            raise
+        finally:
+            self.phase_started_at = None
+
+
+def fresh_vision_path(backend: SimBackend):
+    """Points the supervisor at `backend` with an empty limiter, hedger and breaker."""
+    async_supervisor.get_vision_backend = lambda: backend
+    async_supervisor.vision_limiter = VisionRateLimiter(
+        async_supervisor.VISION_CALLS_PER_MINUTE, async_supervisor.VISION_BURST,
+        async_supervisor.VISION_RUN_BUDGET)
+    async_supervisor.vision_hedger = Hedger(quantile=async_supervisor.HEDGE_QUANTILE)
+    async_supervisor.vision_breaker = CircuitBreaker(
+        async_supervisor.BREAKER_FAILURES, async_supervisor.BREAKER_COOLDOWN_S)
+
+
+@dataclass
+class RunResult:
+    mission_s: float
+    vision_calls: int
+    place_latency_s: Optional[float]
+    light_latency_s: Optional[float]
+    place_exit_s: Optional[float]
+    light_exit_s: Optional[float]
+    reruns: int
+    # Models cancelled before their event really happened
+    false_stops: int
+
+
+def run_once(scenario: Scenario, seed: int, mission_timeout_s: float = 600.0,
+             verbose: bool = False) -> RunResult:
+    loop = VirtualClockLoop()
+
+    async def mission():
+        rng = random.Random(seed)
+        robot = SimRobotAPI(scenario, rng)
+        backend = SimBackend(robot, scenario, rng, deadline_s=async_supervisor.VISION_DEADLINE_S,
+                             max_in_flight=async_supervisor.VISION_MAX_IN_FLIGHT)
+        fresh_vision_path(backend)
+        started = robot.clock()
+        await asyncio.wait_for(async_supervisor.main(robot), timeout=mission_timeout_s)
+        latency = {
+            state: robot.cancelled_at[state] - robot.happened_at[state]
+            for state in (State.PLACE_CANDLE, State.LIGHT_CANDLE)
+            if state in robot.cancelled_at and state in robot.happened_at
+        }
+        exit_latency = {
+            state: robot.left_at[state] - robot.happened_at[state]
+            for state in (State.PLACE_CANDLE, State.LIGHT_CANDLE)
+            if state in robot.left_at and state in robot.happened_at
+        }
+        return RunResult(
+            mission_s=robot.clock() - started,
+            vision_calls=backend.requests,
+            place_latency_s=latency.get(State.PLACE_CANDLE),
+            light_latency_s=latency.get(State.LIGHT_CANDLE),
+            place_exit_s=exit_latency.get(State.PLACE_CANDLE),
+            light_exit_s=exit_latency.get(State.LIGHT_CANDLE),
+            reruns=sum(count - 1 for count in robot.runs.values()),
+            false_stops=sum(1 for s in latency.values() if s < 0),
+        )
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            return loop.run_until_complete(mission())
+    finally:
+        loop.close()
+
+
+def summarize(values, quantiles=(50, 90, 99)) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"n": 0}
+    summary = {"n": len(values), "mean": float(np.mean(values))}
+    for q in quantiles:
+        summary[f"p{q}"] = float(np.percentile(values, q))
+    summary["max"] = float(np.max(values))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", default=Scenario.latency,
+                        help="Vision latency, see standin_server.parse_latency")
+    parser.add_argument("--placed-at", type=float, default=Scenario.placed_at)
+    parser.add_argument("--lit-at", type=float, default=Scenario.lit_at)
+    parser.add_argument("--place-duration", type=float, default=10.0)
+    parser.add_argument("--light-duration", type=float, default=10.0)
+    parser.add_argument("--retract-duration", type=float, default=4.0)
+    parser.add_argument("--miss-rate", type=float, default=0.0)
+    parser.add_argument("--false-rate", type=float, default=0.0,
+                        help="Chance an answer claims the phase's event too early")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the supervisor output")
+    args = parser.parse_args()
+
+    scenario = Scenario(
+        durations={State.PLACE_CANDLE: args.place_duration,
+                   State.LIGHT_CANDLE: args.light_duration,
+                   State.RETRACT_ARM: args.retract_duration},
+        placed_at=args.placed_at, lit_at=args.lit_at,
+        latency=args.latency, miss_rate=args.miss_rate, false_rate=args.false_rate,
+    )
+    started = time.perf_counter()
+    results = [run_once(scenario, args.seed + i, verbose=args.verbose) for i in range(args.runs)]
+    wall_s = time.perf_counter() - started
+
+    summary = {
+        "runs": args.runs,
+        "place_detect_to_cancel_s": summarize([r.place_latency_s for r in results]),
+        "light_detect_to_cancel_s": summarize([r.light_latency_s for r in results]),
+        "place_detect_to_exit_s": summarize([r.place_exit_s for r in results]),
+        "light_detect_to_exit_s": summarize([r.light_exit_s for r in results]),
+        "vision_calls": summarize([r.vision_calls for r in results]),
+        "mission_s": summarize([r.mission_s for r in results]),
+        "reruns": summarize([r.reruns for r in results]),
+        "false_stops": summarize([r.false_stops for r in results]),
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"[Benchmark] {args.runs} simulated missions in {wall_s:.1f}s wall time "
+          f"(latency {args.latency}, placed at {args.placed_at}s, lit at {args.lit_at}s)")
+    for name, stats in summary.items():
+        if name == "runs":
+            continue
+        if not stats["n"]:
+            print(f"  {name:26s} no samples")
+            continue
+        print(f"  {name:26s} p50 {stats['p50']:7.2f}  p90 {stats['p90']:7.2f}  "
+              f"p99 {stats['p99']:7.2f}  max {stats['max']:7.2f}  (n={stats['n']})")
+
+
+if __name__ == "__main__":
+    main()
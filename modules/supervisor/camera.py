@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Optional, Union
+
+import cv2
+
+from frame import Frame
+
+CameraId = Union[int, str]
+
+
+class CameraReader:
+    """
+    Keeps one camera open and reads it continuously in a background thread.
+    Reading as fast as the device delivers drains the stale V4L2 buffers, so
+    the newest entry of the ring buffer is always the most recent frame.
+    """
+    def __init__(self, camera: CameraId, ring_size: int = 2,
+                 width: Optional[int] = None, height: Optional[int] = None,
+                 jpeg_quality: int = 90, verbose: bool = True):
+        self.camera = camera
+        self.jpeg_quality = jpeg_quality
+        self.verbose = verbose
+        self.ring = deque(maxlen=ring_size)
+        self.width = width
+        self.height = height
+        self.frames_read = 0
+        # Called from the reader thread with every new frame, must be quick
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cap = None
+        self.opened_at = 0.0
+
+    def start(self):
+        self._cap = cv2.VideoCapture(self.camera)
+        if not self._cap.isOpened():
+            raise RuntimeError(f"Could not open camera {self.camera}")
+        # Keep the driver queue as short as possible, we only want the newest frame.
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if self.width is not None:
+            self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height is not None:
+            self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.opened_at = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run, name=f"camera-{self.camera}", daemon=True
+        )
+        self._thread.start()
+        if self.verbose:
+            print(f"[Camera] Camera {self.camera} opened")
+
+    def _run(self):
+        while not self._stop.is_set():
+            ret, image = self._cap.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            frame = Frame(image, time.monotonic(), self.camera, self.jpeg_quality)
+            with self._lock:
+                self.ring.append(frame)
+                self.frames_read += 1
+            for listener in list(self.listeners):
+                try:
+                    listener(frame)
+                except Exception as e:
+                    print(f"[Camera] Frame listener failed: {e}")
+
+    def latest(self) -> Optional[Frame]:
+        """Returns the newest frame, or None."""
+        with self._lock:
+            return self.ring[-1] if self.ring else None
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        if self._cap is not None:
+            self._cap.release()
+        if self.verbose:
+            print(f"[Camera] Camera {self.camera} released")
+
+
+class CameraService:
+    """
+    Long-lived capture service. Each camera is opened once, on first use,
+    and kept open in its own reader thread for the lifetime of the service.
+    """
+    def __init__(self, ring_size: int = 2, warmup_s: float = 0.0,
+                 jpeg_quality: int = 90, verbose: bool = True):
+        self.ring_size = ring_size
+        self.jpeg_quality = jpeg_quality
+        self.verbose = verbose
+        # Time to let auto exposure settle after opening a camera.
+        self.warmup_s = warmup_s
+        self._readers: dict = {}
+
+    def start(self, camera: CameraId = 0, **kwargs) -> CameraReader:
+        reader = self._readers.get(camera)
+        if reader is None:
+            reader = CameraReader(
+                camera, ring_size=self.ring_size, jpeg_quality=self.jpeg_quality,
+                verbose=self.verbose, **kwargs
+            )
+            reader.start()
+            self._readers[camera] = reader
+        return reader
+
+    def add_listener(self, camera: CameraId, listener):
+        """Runs `listener(frame)` on every frame `camera` captures, in its reader thread."""
+        self.start(camera).listeners.append(listener)
+
+    def remove_listener(self, camera: CameraId, listener):
+        reader = self._readers.get(camera)
+        if reader is not None and listener in reader.listeners:
+            reader.listeners.remove(listener)
+
+    async def get_latest_frame(self, camera: CameraId = 0, timeout: float = 5.0) -> Frame:
+        """
+        Returns the newest frame of `camera`.
+        Once the camera is warm this is a lock-protected lookup and returns
+        without waiting on the device.
+        """
+        reader = self.start(camera)
+        # A cold camera waits for its first frame after the warm-up period.
+        deadline = time.monotonic() + self.warmup_s + timeout
+        while True:
+            latest = reader.latest()
+            if latest is not None and latest.timestamp >= reader.opened_at + self.warmup_s:
+                return latest
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No frame from camera {camera} after {timeout:.1f}s")
+            await asyncio.sleep(0.01)
+
+    def stop(self):
+        for reader in self._readers.values():
+            reader.stop()
+        self._readers.clear()
@@ -0,0 +1,83 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from vision_result import VisionResult
+
+
+@dataclass
+class ConsensusSpec:
+    """
+    Asks the vision model `k` times in parallel, each on its own frame and at
+    its own temperature, and accepts a verdict once `quorum` answers agree on
+    it. The remaining requests are cancelled then, so a 2-of-3 consensus
+    costs about the latency of the second fastest call.
+    """
+    k: int = 3
+    quorum: int = 2
+    # What the answers have to agree on, e.g. lambda r: r.is_flame_lit
+    key: Callable[[VisionResult], Hashable] = \
+        lambda r: (r.next_state, r.is_candle_in_cake, r.is_flame_lit)
+    # Cycled through by the requests, None uses the backend's default
+    temperatures: Tuple[Optional[float], ...] = (None, 0.2, 0.8)
+    # Wait between the frames of the requests, so they see different frames
+    frame_spacing_s: float = 0.05
+
+    def temperature(self, i: int) -> Optional[float]:
+        return self.temperatures[i % len(self.temperatures)] if self.temperatures else None
+
+
+@dataclass
+class Consensus:
+    # Most recent answer with the winning verdict, None if nothing came back
+    result: Optional[VisionResult]
+    votes: int
+    answered: int
+    asked: int
+    reached: bool
+    tally: Dict[Hashable, int] = field(default_factory=dict)
+
+    @property
+    def agreement(self) -> float:
+        """Share of the answers received that back the verdict."""
+        return self.votes / self.answered if self.answered else 0.0
+
+    def __str__(self):
+        verdict = "quorum" if self.reached else "no quorum"
+        return (f"{verdict}, {self.votes}/{self.answered} answers agree "
+                f"({self.asked} asked, {self.asked - self.answered} not needed or failed)")
+
+
+async def vote(requests: Iterable[asyncio.Task], quorum: int,
+               key: Callable[[VisionResult], Hashable]) -> Consensus:
+    """
+    Waits for the answers of `requests` until `quorum` of them agree on `key`.
+    Requests still running then are cancelled. Failed or empty answers do not
+    vote. Without a quorum the plurality verdict is reported, with `reached`
+    False.
+    """
+    pending = set(requests)
+    asked = len(pending)
+    tally: Dict[Hashable, int] = {}
+    latest: Dict[Hashable, VisionResult] = {}
+    answered = 0
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for request in done:
+                if request.cancelled() or request.exception() is not None or request.result() is None:
+                    continue
+                result = request.result()
+                answered += 1
+                verdict = key(result)
+                tally[verdict] = tally.get(verdict, 0) + 1
+                latest[verdict] = result
+                if tally[verdict] >= quorum:
+                    return Consensus(result, tally[verdict], answered, asked, True, tally)
+    finally:
+        for request in pending:
+            request.cancel()
+    if not tally:
+        return Consensus(None, 0, 0, asked, False, tally)
+    verdict = max(tally, key=tally.get)
+    return Consensus(latest[verdict], tally[verdict], answered, asked, False, tally)
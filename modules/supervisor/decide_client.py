@@ -0,0 +1,44 @@
+"""
+Client for the resident decide_next service (decide_next.py --serve).
+
+Standard library only, so it starts in milliseconds: sends the phase that is
+running and prints the next one for bash_control.sh.
+
+    python3 decide_client.py candle
+    python3 decide_client.py --ping   # exit code 0 if the service is up
+"""
+import os
+import socket
+import sys
+
+SOCKET_PATH = os.getenv("DECIDE_SOCKET", "/tmp/decide_next.sock")
+
+
+def ping() -> int:
+    """0 if a service accepts connections on SOCKET_PATH, 1 if not (e.g. a stale socket)."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(SOCKET_PATH)
+    except OSError:
+        return 1
+    return 0
+
+
+def main() -> int:
+    if sys.argv[1:] == ["--ping"]:
+        return ping()
+    previous = sys.argv[1] if len(sys.argv) > 1 else ""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(SOCKET_PATH)
+            sock.sendall((previous.replace("\n", " ") + "\n").encode())
+            answer = sock.makefile().readline().strip()
+    except OSError as e:
+        print(f"[DecideClient] No decide_next service on {SOCKET_PATH}: {e}", file=sys.stderr)
+        return 1
+    print(answer)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class FlameReading:
+    lit: Optional[bool]  # None means ambiguous, ask the vision model
+    fraction: float  # share of ROI pixels that look like flame
+    flicker: float  # coefficient of variation of the flame area over the window
+
+
+class FlameDetector:
+    """
+    Local flame detector, cheap enough to run on every captured frame.
+
+    A flame shows up as a blob of very bright, saturated orange/yellow pixels.
+    Pixels are thresholded in HSV over a region of interest around the candle
+    wick, and the blob area is tracked over a short window: a real flame
+    flickers, a bright orange object does not.
+    """
+    def __init__(self, roi=None, long_side: int = 360,
+                 hue_range=(5, 35), s_min: int = 80, v_min: int = 220,
+                 on_fraction: float = 3e-4, off_fraction: float = 5e-5,
+                 window: int = 5, min_flicker: float = 0.03):
+        # roi is [y0, x0, y1, x1] normalized to 0-1000, like the model's points
+        self.roi = roi
+        self.long_side = long_side
+        self.lower = np.array([hue_range[0], s_min, v_min], dtype=np.uint8)
+        self.upper = np.array([hue_range[1], 255, 255], dtype=np.uint8)
+        self.on_fraction = on_fraction
+        self.off_fraction = off_fraction
+        self.min_flicker = min_flicker
+        self.areas = deque(maxlen=window)
+
+    def _crop(self, image: np.ndarray) -> np.ndarray:
+        if self.roi is not None:
+            height, width = image.shape[:2]
+            y0, x0, y1, x1 = self.roi
+            image = image[int(y0 * height / 1000):int(y1 * height / 1000),
+                          int(x0 * width / 1000):int(x1 * width / 1000)]
+        height, width = image.shape[:2]
+        scale = self.long_side / max(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (int(width * scale), int(height * scale)),
+                               interpolation=cv2.INTER_AREA)
+        return image
+
+    def flame_fraction(self, image: np.ndarray) -> float:
+        """Share of ROI pixels inside the largest flame-coloured blob."""
+        roi = self._crop(image)
+        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, self.lower, self.upper)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if count < 2:
+            return 0.0
+        return float(stats[1:, cv2.CC_STAT_AREA].max()) / mask.size
+
+    def classify(self, image: np.ndarray) -> Optional[bool]:
+        """Single-frame verdict, without the flicker check."""
+        fraction = self.flame_fraction(image)
+        if fraction >= self.on_fraction:
+            return True
+        if fraction <= self.off_fraction:
+            return False
+        return None
+
+    def update(self, image: np.ndarray) -> FlameReading:
+        """Adds a frame to the window and returns the current verdict."""
+        fraction = self.flame_fraction(image)
+        self.areas.append(fraction)
+        areas = np.asarray(self.areas)
+        mean = areas.mean()
+        flicker = float(areas.std() / mean) if mean > 0 else 0.0
+        lit = None
+        if areas.max() <= self.off_fraction:
+            lit = False
+        elif len(self.areas) == self.areas.maxlen and (areas >= self.on_fraction).all():
+            # Bright in every frame: a flame if it flickers, otherwise let the model decide
+            lit = True if flicker >= self.min_flicker else None
+        return FlameReading(lit, fraction, flicker)
+
+    def reset(self):
+        self.areas.clear()
+
+
+def parse_roi(value: Optional[str]):
+    """Parses "y0,x0,y1,x1" (0-1000) into a list, or None for the full frame."""
+    if not value:
+        return None
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    # Single-frame check against the labeled images
+    images_directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "images")
+    labeled = {
+        "flame_on_test.jpg": True,
+        "flame_off_test.jpg": False,
+        "idle.jpg": False,
+        "has_candle.jpg": False,
+        "in_cake.jpg": False,
+        "picking_up.jpg": False,
+    }
+    detector = FlameDetector()
+    correct = 0
+    for name, expected in labeled.items():
+        image = cv2.imread(os.path.join(images_directory, name))
+        start = time.perf_counter()
+        verdict = detector.classify(image)
+        elapsed = time.perf_counter() - start
+        correct += verdict == expected
+        print(f"{name}: lit={verdict} expected={expected} "
+              f"fraction={detector.flame_fraction(image):.2e} ({elapsed * 1000:.1f} ms)")
+    print(f"{correct}/{len(labeled)} correct")
@@ -0,0 +1,107 @@
+import asyncio
+import dataclasses
+import os
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from tracing import tracer
+
+
+@dataclasses.dataclass
+class Frame:
+    """A captured camera frame that lives in memory from capture to upload.
+
+    The JPEG bytes sent to the vision model are encoded on first use and cached,
+    so every consumer of the same frame shares a single encode.
+    """
+    image: np.ndarray  # BGR, as returned by cv2
+    timestamp: float  # time.monotonic() at capture
+    camera: Union[int, str] = 0
+    jpeg_quality: int = 90
+    _jpeg: Optional[bytes] = dataclasses.field(default=None, repr=False)
+
+    @property
+    def jpeg_bytes(self) -> bytes:
+        if self._jpeg is None:
+            with tracer.span("jpeg_encode", camera=self.camera):
+                ok, buf = cv2.imencode(
+                    ".jpg", self.image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+                )
+            if not ok:
+                raise ValueError(f"Could not encode frame from camera {self.camera}")
+            self._jpeg = buf.tobytes()
+        return self._jpeg
+
+    @property
+    def size(self):
+        """(width, height) in pixels."""
+        return self.image.shape[1], self.image.shape[0]
+
+
+def image_bytes(image: Union[Frame, str]) -> bytes:
+    """JPEG bytes for a frame, or for an image file on disk."""
+    if isinstance(image, Frame):
+        return image.jpeg_bytes
+    with open(image, "rb") as f:
+        return f.read()
+
+
+class FrameArchive:
+    """Saves a sample of frames to disk for debugging, off the critical path.
+
+    `submit` never blocks: frames are queued and written by a background task,
+    and dropped if the writer falls behind.
+    """
+    def __init__(self, directory: str, every_n: int = 1, max_queue: int = 8):
+        self.directory = directory
+        self.every_n = max(1, every_n)
+        self.saved = 0
+        self.dropped = 0
+        self._seen = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, frame: Frame):
+        self._seen += 1
+        if (self._seen - 1) % self.every_n:
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        try:
+            self._queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        while True:
+            frame = await self._queue.get()
+            name = f"frame_{frame.camera}_{int(frame.timestamp * 1000)}.jpg"
+            path = os.path.join(self.directory, name)
+            try:
+                # The upload encodes its own crop, so the full frame is encoded here, off the loop
+                await asyncio.to_thread(lambda: _write_bytes(path, frame.jpeg_bytes))
+                self.saved += 1
+            except Exception as e:
+                self.dropped += 1
+                print(f"[FrameArchive] Could not save {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def close(self):
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+def _write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
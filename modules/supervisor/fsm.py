@@ -0,0 +1,187 @@
+"""
+Table-driven state machine for the supervisor.
+
+Every state is described by a StateSpec: an optional long-running model
+(`action`) raced against a vision monitor, entry/exit hooks, guards that pick
+the next state from the latest perception, a timeout and a call-rate bound.
+States without an action are perception states: they poll the vision model
+with exponential backoff until a guard matches.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from vision_result import State
+
+
+@dataclass
+class Transition:
+    # None ends the mission
+    target: Optional[State]
+    # Checked against the robot, which mirrors the latest VisionResult fields
+    guard: Callable[[Any], bool]
+    reason: str
+
+
+@dataclass
+class MonitorSpec:
+    """How monitor_general watches the state's model."""
+    success: Callable[[Any], bool]
+    local_check: Optional[Callable[[Any], Optional[bool]]] = None
+    # Builds a fresh CheckScheduler for every attempt
+    scheduler: Optional[Callable[[], Any]] = None
+    check_interval: float = 5.0
+    # Manual override: called with every key press, True stops the model
+    on_key: Optional[Callable[[Any, Any], bool]] = None
+    # Positive answers are confirmed by a parallel vote (consensus.ConsensusSpec)
+    # before they count, routine checks stay single calls
+    consensus: Optional[Any] = None
+
+
+@dataclass
+class StateSpec:
+    transitions: List[Transition]
+    # Long-running model started on entry, e.g. lambda robot: robot.run_model(...)
+    action: Optional[Callable[[Any], Awaitable]] = None
+    monitor: Optional[MonitorSpec] = None
+    on_enter: Optional[Callable[[Any], None]] = None
+    on_exit: Optional[Callable[[Any], None]] = None
+    # Where to go when the state times out or runs out of attempts (None ends the mission)
+    timeout_s: Optional[float] = None
+    fallback: Optional[State] = None
+    max_attempts: int = 3
+    # Hard bound on vision calls while in this state
+    max_calls_per_minute: float = 12.0
+    # Backoff between polls that found nothing actionable
+    backoff_base_s: float = 1.0
+    backoff_factor: float = 2.0
+    backoff_max_s: float = 30.0
+    # Consensus for the polls of a perception state
+    consensus: Optional[Any] = None
+
+    @property
+    def min_call_interval(self) -> float:
+        return 60.0 / self.max_calls_per_minute
+
+
+@dataclass
+class TransitionRecord:
+    source: State
+    target: Optional[State]
+    reason: str
+    duration_s: float
+    vision_calls: int
+    attempts: int
+
+
+class StateMachine:
+    """
+    Runs `table` on `robot`. `monitor` is the coroutine function that watches
+    an action (monitor_general), passed in so this module stays independent of
+    the robot implementation. `keys` is the KeyListener feeding monitors that
+    have an `on_key` handler.
+    """
+    def __init__(self, robot, table: Dict[State, StateSpec], monitor: Callable[..., Awaitable],
+                 keys=None):
+        self.robot = robot
+        self.table = table
+        self.monitor = monitor
+        self.keys = keys
+        # One record per transition, with how long the state took
+        self.log: List[TransitionRecord] = []
+        self._attempts = 0
+
+    async def run(self, initial: State):
+        state = initial
+        self.robot.transition(state)
+        while state is not None:
+            spec = self.table[state]
+            entered = self.robot.clock()
+            calls = self.robot.vision_calls
+            self._attempts = 0
+            try:
+                target, reason = await asyncio.wait_for(self._run_state(state, spec), spec.timeout_s)
+            except asyncio.TimeoutError:
+                target, reason = spec.fallback, f"timed out after {spec.timeout_s:.0f}s"
+            record = TransitionRecord(state, target, reason, self.robot.clock() - entered,
+                                      self.robot.vision_calls - calls, self._attempts)
+            self.log.append(record)
+            print(f"[FSM] {state.value} -> {target.value if target else 'done'} "
+                  f"after {record.duration_s:.1f}s ({reason}, {record.vision_calls} vision calls, "
+                  f"{record.attempts} attempts)")
+            if target is not None:
+                self.robot.transition(target)
+            state = target
+
+    def _match(self, spec: StateSpec) -> Optional[Transition]:
+        for transition in spec.transitions:
+            if transition.guard(self.robot):
+                return transition
+        return None
+
+    async def _run_state(self, state: State, spec: StateSpec) -> Tuple[Optional[State], str]:
+        if spec.on_enter is not None:
+            spec.on_enter(self.robot)
+        try:
+            if spec.action is None:
+                return await self._poll(state, spec)
+            return await self._act(state, spec)
+        finally:
+            if spec.on_exit is not None:
+                spec.on_exit(self.robot)
+
+    async def _poll(self, state: State, spec: StateSpec) -> Tuple[Optional[State], str]:
+        """Asks the vision model until a guard matches, backing off while nothing does."""
+        misses = 0
+        while True:
+            self._attempts += 1
+            started = self.robot.clock()
+            result = await self.robot.picture_and_run_vision_model(consensus=spec.consensus)
+            transition = self._match(spec) if result is not None else None
+            if transition is not None:
+                return transition.target, transition.reason
+            misses += 1
+            delay = min(spec.backoff_max_s,
+                        spec.backoff_base_s * spec.backoff_factor ** (misses - 1))
+            # Never start calls closer together than the state's rate bound
+            calls = spec.consensus.k if spec.consensus is not None else 1
+            delay = max(delay, calls * spec.min_call_interval - (self.robot.clock() - started))
+            print(f"[FSM][{state.value}] Nothing actionable, looking again in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _act(self, state: State, spec: StateSpec) -> Tuple[Optional[State], str]:
+        """Runs the state's model under its monitor, retrying until a guard matches."""
+        for attempt in range(1, spec.max_attempts + 1):
+            self._attempts = attempt
+            task = asyncio.create_task(spec.action(self.robot))
+            keys = None
+            if spec.monitor is not None and spec.monitor.on_key is not None and self.keys is not None:
+                keys = self.keys.subscribe()
+            try:
+                if spec.monitor is not None:
+                    monitor = spec.monitor
+                    await self.monitor(
+                        self.robot, task,
+                        check_interval=max(monitor.check_interval, spec.min_call_interval),
+                        function_to_check=monitor.success,
+                        local_check=monitor.local_check,
+                        scheduler=monitor.scheduler() if monitor.scheduler else None,
+                        min_interval=spec.min_call_interval,
+                        keys=keys,
+                        on_key=monitor.on_key,
+                        consensus=monitor.consensus,
+                    )
+                await asyncio.wait([task])
+            finally:
+                if keys is not None:
+                    self.keys.unsubscribe(keys)
+                if not task.done():
+                    task.cancel()
+                    await asyncio.wait([task])
+            if not task.cancelled() and task.exception() is not None:
+                print(f"[FSM][{state.value}] Model failed: {task.exception()!r}")
+            transition = self._match(spec)
+            if transition is not None:
+                return transition.target, transition.reason
+            print(f"[FSM][{state.value}] Attempt {attempt}/{spec.max_attempts} ended without success.")
+        return spec.fallback, f"no success after {spec.max_attempts} attempts"
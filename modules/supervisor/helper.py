@@ -36,11 +36,14 @@ def label_image(path, image_name, points_labels):
         print(f"Saved annotated image to {os.path.join(path, f'annotated_{image_name}')}")
 
 
-def get_image_resized(img_path):
+def get_image_resized(img_path, long_side=None):
     img = Image.open(img_path)
-    img = img.resize(
-        (800, int(800 * img.size[1] / img.size[0])), Image.Resampling.LANCZOS
-    )
+    if long_side is None:
+        size = (800, int(800 * img.size[1] / img.size[0]))
+    else:
+        from preprocess import scaled_size
+        size = scaled_size(img.size, long_side)
+    img = img.resize(size, Image.Resampling.LANCZOS)
     return img
 
 
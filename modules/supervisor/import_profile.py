@@ -0,0 +1,57 @@
+"""
+Per-module import cost of an entry point.
+
+Imports the module in a fresh interpreter with `python -X importtime`, so the
+numbers are a real cold start, and prints the most expensive imports and the
+total against a budget.
+
+    python async_supervisor.py --import-profile
+    python import_profile.py decide_next --budget 0.25
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Optional
+
+
+def profile(module: str, budget_s: Optional[float] = None, top: int = 12) -> bool:
+    """Prints the import profile of `module`. Returns False if it is over `budget_s`."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=directory, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        print(completed.stderr.strip().splitlines()[-1])
+        return False
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name[1:].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    total_s = next(cumulative for cumulative, _, depth, name in entries
+                   if depth == 0 and name == module) / 1e6
+    print(f"[ImportProfile] {module}: {total_s * 1000:.0f} ms cold import")
+    # Direct children of the entry point and anything expensive on its own
+    shown = sorted((e for e in entries if e[2] == 1 or e[1] > 10_000), reverse=True)[:top]
+    for cumulative, self_us, _, name in shown:
+        print(f"  {cumulative / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {name}")
+    if budget_s is None:
+        return True
+    ok = total_s <= budget_s
+    print(f"[ImportProfile] {'Within' if ok else 'OVER'} the {budget_s * 1000:.0f} ms budget")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("module")
+    parser.add_argument("--budget", type=float, default=None, help="Seconds")
+    parser.add_argument("--top", type=int, default=12)
+    args = parser.parse_args()
+    sys.exit(0 if profile(args.module, args.budget, args.top) else 1)
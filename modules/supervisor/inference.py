@@ -1,5 +1,23 @@
+"""
+Policy rollouts without a dataset.
+
+`record_loop` is lerobot-record's control loop. Given a `dataset` it writes
+every frame like lerobot-record does; without one it only runs the policy, so
+no video is encoded and nothing has to be deleted afterwards. `rollout` is the
+entry point for that mode, optionally keeping the last `ring_size` frames in
+memory for debugging:
+
+    uv run inference.py --robot.type=so100_follower --robot.port=/dev/ttyACM2 ... \
+        --policy.path=gyger/act-candle-cake --task="Grab the candle and place it into the cake." \
+        --episode_time_s=180 --ring_size=90 --ring_dump_dir=outputs/last_rollout
+
+Rollouts read the cameras in background threads (see prefetch.py) and run the
+loop on a fixed schedule; pass --prefetch=false to read them inline like
+lerobot-record.
+"""
 import logging
 import time
+from collections import deque
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from pprint import pformat
@@ -17,7 +35,7 @@ from lerobot.datasets.lerobot_dataset import LeRobotDataset
 from lerobot.datasets.pipeline_features import aggregate_pipeline_dataset_features, create_initial_features
 from lerobot.datasets.utils import build_dataset_frame, combine_feature_dicts
 from lerobot.datasets.video_utils import VideoEncodingManager
-from lerobot.policies.factory import make_policy, make_pre_post_processors
+from lerobot.policies.factory import get_policy_class, make_policy, make_pre_post_processors
 from lerobot.policies.pretrained import PreTrainedPolicy
 from lerobot.policies.utils import make_robot_action
 from lerobot.processor import (
@@ -59,7 +77,6 @@ from lerobot.utils.control_utils import (
     sanity_check_dataset_robot_compatibility,
 )
 from lerobot.utils.import_utils import register_third_party_devices
-from lerobot.utils.robot_utils import busy_wait
 from lerobot.utils.utils import (
     get_safe_torch_device,
     init_logging,
@@ -67,8 +84,44 @@ from lerobot.utils.utils import (
 )
 from lerobot.utils.visualization_utils import init_rerun, log_rerun_data
 
+from prefetch import SPIN_S, ObservationPrefetcher, TickStats, sleep_until
+
 # no problems in import
 
+
+def robot_features(
+    robot: Robot,
+    robot_action_processor: RobotProcessorPipeline,
+    robot_observation_processor: RobotProcessorPipeline,
+) -> dict:
+    """The feature layout lerobot-record would create its dataset with, without creating one."""
+    return combine_feature_dicts(
+        aggregate_pipeline_dataset_features(
+            pipeline=robot_action_processor,
+            initial_features=create_initial_features(action=robot.action_features),
+            use_videos=True,
+        ),
+        aggregate_pipeline_dataset_features(
+            pipeline=robot_observation_processor,
+            initial_features=create_initial_features(observation=robot.observation_features),
+            use_videos=True,
+        ),
+    )
+
+
+def load_pretrained(
+    cfg: PreTrainedConfig,
+) -> tuple[PreTrainedPolicy, PolicyProcessorPipeline, PolicyProcessorPipeline]:
+    """Policy and its processors from `cfg.pretrained_path`, on `cfg.device`."""
+    policy = get_policy_class(cfg.type).from_pretrained(cfg.pretrained_path, config=cfg)
+    preprocessor, postprocessor = make_pre_post_processors(
+        policy_cfg=cfg,
+        pretrained_path=cfg.pretrained_path,
+        preprocessor_overrides={"device_processor": {"device": cfg.device}},
+    )
+    return policy, preprocessor, postprocessor
+
+
 @safe_stop_image_writer
 def record_loop(
     robot: Robot,
@@ -83,9 +136,23 @@ def record_loop(
     policy: PreTrainedPolicy | None = None,
     preprocessor: PolicyProcessorPipeline[dict[str, Any], dict[str, Any]] | None = None,
     postprocessor: PolicyProcessorPipeline[PolicyAction, PolicyAction] | None = None,
+    dataset: LeRobotDataset | None = None,
+    # Feature layout to build frames from when there is no dataset, see robot_features
+    dataset_features: dict | None = None,
     control_time_s: int | None = None,
     single_task: str | None = None,
+    display_data: bool = False,
+    # Keeps (timestamp, observation, action) of the most recent ticks, bounded by its maxlen
+    frame_ring: deque | None = None,
+    # Serves observations from camera reader threads instead of robot.get_observation()
+    prefetcher: ObservationPrefetcher | None = None,
+    tick_stats: TickStats | None = None,
+    # Time spun before each tick instead of sleeping, see sleep_until
+    spin_s: float = SPIN_S,
 ):
+    features = dataset.features if dataset is not None else dataset_features
+    if policy is not None and features is None:
+        raise ValueError("record_loop needs a dataset or dataset_features to run a policy")
 
     # Reset policy and processor if they are provided
     if policy is not None and preprocessor is not None and postprocessor is not None:
@@ -95,6 +162,8 @@ def record_loop(
 
     timestamp = 0
     start_episode_t = time.perf_counter()
+    # Ticks start on a fixed schedule, so a slow tick does not shift all the ones after it
+    next_tick_t = start_episode_t
     while timestamp < control_time_s:
         start_loop_t = time.perf_counter()
 
@@ -103,13 +172,13 @@ def record_loop(
             break
 
         # Get robot observation
-        obs = robot.get_observation()
+        obs = prefetcher.get_observation() if prefetcher is not None else robot.get_observation()
 
         # Applies a pipeline to the raw robot observation, default is IdentityProcessor
         obs_processed = robot_observation_processor(obs)
 
         if policy is not None or dataset is not None:
-            observation_frame = build_dataset_frame(dataset.features, obs_processed, prefix=OBS_STR)
+            observation_frame = build_dataset_frame(features, obs_processed, prefix=OBS_STR)
 
         if policy is not None and preprocessor is not None and postprocessor is not None:
             action_values = predict_action(
@@ -122,15 +191,130 @@ def record_loop(
                 task=single_task,
                 robot_type=robot.robot_type,
             )
-            act_processed_policy: RobotAction = make_robot_action(action_values, dataset.features)
-    
-        if policy is not None and act_processed_policy is not None:
-            action_values = act_processed_policy
+            act_processed_policy: RobotAction = make_robot_action(action_values, features)
+        else:
+            # Without a policy there is nothing to send, only observe
+            act_processed_policy = None
+
+        if act_processed_policy is not None:
             robot_action_to_send = robot_action_processor((act_processed_policy, obs))
+            _sent_action = robot.send_action(robot_action_to_send)
+
+        if dataset is not None and act_processed_policy is not None:
+            action_frame = build_dataset_frame(features, act_processed_policy, prefix=ACTION)
+            dataset.add_frame({**observation_frame, **action_frame, "task": single_task})
+
+        if frame_ring is not None:
+            frame_ring.append((timestamp, obs_processed, act_processed_policy))
+
+        if display_data:
+            log_rerun_data(observation=obs_processed, action=act_processed_policy)
+
+        end_loop_t = time.perf_counter()
+        if tick_stats is not None:
+            tick_stats.tick(next_tick_t, start_loop_t, end_loop_t)
+            next_tick_t = tick_stats.next_deadline(next_tick_t, end_loop_t)
+        else:
+            next_tick_t = max(next_tick_t + 1 / fps, end_loop_t)
+        sleep_until(next_tick_t, spin_s)
+
+        timestamp = time.perf_counter() - start_episode_t
+
+
+@dataclass
+class RolloutConfig:
+    robot: RobotConfig
+    policy: PreTrainedConfig | None = None
+    task: str = ""
+    fps: int = 30
+    episode_time_s: int | float = 60
+    display_data: bool = False
+    # Number of recent frames kept in memory, 0 keeps none
+    ring_size: int = 0
+    # Where to save the ring's camera frames when the rollout ends, None keeps them in memory only
+    ring_dump_dir: Path | None = None
+    # Read the cameras in background threads, see prefetch.py
+    prefetch: bool = True
+    # Spread between the cameras' capture times above which an observation is counted in the stats
+    camera_skew_alert_s: float = 0.02
+    # Time spun before each tick, the rest of the wait sleeps
+    spin_s: float = SPIN_S
+
+    def __post_init__(self):
+        policy_path = parser.get_path_arg("policy")
+        if policy_path:
+            cli_overrides = parser.get_cli_overrides("policy")
+            self.policy = PreTrainedConfig.from_pretrained(policy_path, cli_overrides=cli_overrides)
+            self.policy.pretrained_path = policy_path
+        if self.policy is None:
+            raise ValueError("A rollout needs a policy, pass --policy.path")
+
+    @classmethod
+    def __get_path_fields__(cls) -> list[str]:
+        return ["policy"]
+
+
+def dump_frame_ring(frame_ring: deque, out_dir: Path):
+    """Writes the camera images of every frame in the ring as PNGs, oldest first."""
+    from PIL import Image
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for i, (timestamp, observation, _action) in enumerate(frame_ring):
+        for key, value in observation.items():
+            if getattr(value, "ndim", 0) == 3:
+                Image.fromarray(value).save(out_dir / f"{i:04d}_{timestamp:07.3f}s_{key}.png")
+    logging.info(f"[Rollout] Saved {len(frame_ring)} frames to {out_dir}")
+
+
+@parser.wrap()
+def rollout(cfg: RolloutConfig):
+    init_logging()
+    logging.info(pformat(asdict(cfg)))
+    robot = make_robot_from_config(cfg.robot)
+    _, robot_action_processor, robot_observation_processor = make_default_processors()
+    features = robot_features(robot, robot_action_processor, robot_observation_processor)
+    policy, preprocessor, postprocessor = load_pretrained(cfg.policy)
+    frame_ring = deque(maxlen=cfg.ring_size) if cfg.ring_size > 0 else None
 
-        _sent_action = robot.send_action(robot_action_to_send)
+    if cfg.display_data:
+        init_rerun(session_name="rollout")
+    robot.connect()
+    prefetcher = None
+    tick_stats = TickStats(cfg.fps)
+    listener, events = init_keyboard_listener()
+    try:
+        if cfg.prefetch:
+            prefetcher = ObservationPrefetcher.for_robot(robot, skew_alert_s=cfg.camera_skew_alert_s)
+            prefetcher.start()
+        record_loop(
+            robot=robot,
+            robot_action_processor=robot_action_processor,
+            robot_observation_processor=robot_observation_processor,
+            events=events,
+            fps=cfg.fps,
+            policy=policy,
+            preprocessor=preprocessor,
+            postprocessor=postprocessor,
+            dataset_features=features,
+            control_time_s=cfg.episode_time_s,
+            single_task=cfg.task,
+            display_data=cfg.display_data,
+            frame_ring=frame_ring,
+            prefetcher=prefetcher,
+            tick_stats=tick_stats,
+            spin_s=cfg.spin_s,
+        )
+    finally:
+        if prefetcher is not None:
+            prefetcher.stop()
+            logging.info(f"[Prefetch] {prefetcher.stats()}")
+        logging.info(f"[Rollout] {tick_stats.stats()}")
+        robot.disconnect()
+        if listener is not None and not is_headless():
+            listener.stop()
+        if frame_ring and cfg.ring_dump_dir is not None:
+            dump_frame_ring(frame_ring, cfg.ring_dump_dir)
 
-        dt_s = time.perf_counter() - start_loop_t
-        busy_wait(1 / fps - dt_s)
 
-        timestamp = time.perf_counter() - start_episode_t
\ No newline at end of file
+if __name__ == "__main__":
+    rollout()
@@ -0,0 +1,159 @@
+"""
+Non-blocking keyboard input for the supervisor.
+
+On POSIX the terminal is put in cbreak mode and stdin is registered with the
+event loop, so a key press is handled on the next loop iteration and no
+thread sits in getch. Windows has no readable-stdin notification, so there
+the console is polled with msvcrt every few milliseconds instead.
+
+Every key is published to the queues of the current subscribers, e.g. a
+monitor waiting on a key alongside its vision checks.
+
+    python keyboard.py --bench
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+if sys.platform.startswith('win'):
+    import msvcrt
+else:
+    import termios
+    import tty
+
+
+@dataclass
+class KeyEvent:
+    key: str
+    # time.perf_counter() when the key was read
+    received_at: float
+
+
+class KeyListener:
+    def __init__(self, fd: Optional[int] = None, poll_interval: float = 0.005):
+        # stdin unless given, resolved in start() so that building a listener never fails
+        self.fd = fd
+        self.poll_interval = poll_interval
+        self._subscribers: List[asyncio.Queue] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._saved_mode = None
+        self._poll_handle = None
+        self.running = False
+
+    def start(self) -> bool:
+        """Starts listening. Returns False if there is no terminal to listen to."""
+        self._loop = asyncio.get_running_loop()
+        if sys.platform.startswith('win'):
+            self._poll_handle = self._loop.call_soon(self._poll)
+        else:
+            if self.fd is None:
+                try:
+                    self.fd = sys.stdin.fileno()
+                except (io.UnsupportedOperation, ValueError):
+                    # e.g. pytest's capture or a closed stdin
+                    print("[Keyboard] stdin has no file descriptor, manual override disabled")
+                    return False
+            if not os.isatty(self.fd):
+                print("[Keyboard] stdin is not a terminal, manual override disabled")
+                return False
+            self._saved_mode = termios.tcgetattr(self.fd)
+            # cbreak rather than raw, so Ctrl-C still stops the supervisor
+            tty.setcbreak(self.fd)
+            self._loop.add_reader(self.fd, self._on_readable)
+        self.running = True
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if sys.platform.startswith('win'):
+            self._poll_handle.cancel()
+        else:
+            self._loop.remove_reader(self.fd)
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self._saved_mode)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue receiving every KeyEvent from now until `unsubscribe`."""
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def _publish(self, key: str, received_at: float):
+        event = KeyEvent(key, received_at)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def _on_readable(self):
+        received_at = time.perf_counter()
+        try:
+            data = os.read(self.fd, 64)
+        except OSError:
+            return
+        for key in data.decode('utf-8', errors='replace'):
+            self._publish(key, received_at)
+
+    def _poll(self):
+        while msvcrt.kbhit():
+            self._publish(msvcrt.getwch(), time.perf_counter())
+        self._poll_handle = self._loop.call_later(self.poll_interval, self._poll)
+
+
+async def _bench(trials: int) -> List[float]:
+    """Key-to-cancel latency through a pseudo-terminal, in seconds."""
+    master, slave = os.openpty()
+    listener = KeyListener(fd=slave)
+    listener.start()
+    latencies = []
+    try:
+        for _ in range(trials):
+            keys = listener.subscribe()
+            task = asyncio.create_task(asyncio.sleep(60))
+            os.write(master, b"k")
+            pressed = time.perf_counter()
+            await keys.get()
+            task.cancel()
+            latencies.append(time.perf_counter() - pressed)
+            listener.unsubscribe(keys)
+            await asyncio.sleep(0.01)
+    finally:
+        listener.stop()
+        os.close(master)
+        os.close(slave)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bench", action="store_true",
+                        help="Measure key-to-cancel latency through a pty")
+    parser.add_argument("--trials", type=int, default=200)
+    args = parser.parse_args()
+    if args.bench:
+        latencies = sorted(asyncio.run(_bench(args.trials)))
+        print(f"[Keyboard] key-to-cancel p50 {statistics.median(latencies) * 1000:.3f} ms, "
+              f"p99 {latencies[int(0.99 * (len(latencies) - 1))] * 1000:.3f} ms, "
+              f"max {latencies[-1] * 1000:.3f} ms over {len(latencies)} presses")
+    else:
+        async def echo():
+            listener = KeyListener()
+            if not listener.start():
+                return
+            keys = listener.subscribe()
+            print("[Keyboard] Press keys, q to quit")
+            try:
+                while (event := await keys.get()).key != 'q':
+                    print(f"[Keyboard] Key pressed: {event.key!r}")
+            finally:
+                listener.stop()
+        asyncio.run(echo())
@@ -0,0 +1,250 @@
+"""
+Persistent serial link to the lighter relay.
+
+The port is opened once at startup and kept open. Opening it makes the
+Arduino reset, so only the first connect pays for the bootloader. Incoming
+bytes are read by a reader registered with the event loop; where the loop
+or the port cannot do that (Windows) the port is polled every few
+milliseconds instead, like the keyboard. Either way `await lighter.fire()`
+never blocks the loop. If the firmware answers a fire
+command, the round trip is recorded as the acknowledgement latency.
+
+Try it without hardware against a pseudo-terminal stand-in:
+
+    python lighter.py --standin
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+import serial
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LighterController:
+    """
+    Keeps the relay's serial port open and fires the lighter on request.
+    A lost port is reopened on the next `fire()`.
+    """
+    def __init__(self, port: str, baudrate: int = 9600, fire_command: bytes = b'1',
+                 settle_s: float = 2.0, ack_timeout_s: float = 0.5,
+                 reconnect_attempts: int = 3, reconnect_delay_s: float = 1.0,
+                 poll_interval: float = 0.005):
+        self.port = port
+        self.baudrate = baudrate
+        self.fire_command = fire_command
+        # Time the Arduino bootloader needs after the port is opened
+        self.settle_s = settle_s
+        self.ack_timeout_s = ack_timeout_s
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay_s = reconnect_delay_s
+        self.poll_interval = poll_interval
+        self._serial: Optional[serial.Serial] = None
+        self._fd: Optional[int] = None
+        self._poll_handle: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._received: Optional[asyncio.Queue] = None
+        self._lock = asyncio.Lock()
+        self.fires = 0
+        self.acks = 0
+        self.reconnects = 0
+        self.write_latencies: List[float] = []
+        self.ack_latencies: List[float] = []
+
+    @property
+    def connected(self) -> bool:
+        return self._serial is not None
+
+    async def connect(self) -> bool:
+        """Opens the port and waits for the board to come up. Returns False on failure."""
+        if self.connected:
+            return True
+        self._loop = asyncio.get_running_loop()
+        self._received = asyncio.Queue()
+        try:
+            port = serial.Serial()
+            port.port = self.port
+            port.baudrate = self.baudrate
+            port.timeout = 0
+            # Keeps boards that honour DTR from resetting on open
+            port.dtr = False
+            port.open()
+        except (serial.SerialException, OSError) as e:
+            print(f"[Lighter] Could not open {self.port}: {e}")
+            return False
+        self._serial = port
+        try:
+            self._fd = port.fileno()
+            self._loop.add_reader(self._fd, self._on_readable)
+        except (AttributeError, NotImplementedError, OSError):
+            # pyserial's win32 port has no fileno and the Proactor loop no add_reader
+            self._fd = None
+            self._poll_handle = self._loop.call_soon(self._poll)
+        # Whatever the bootloader prints is dropped before the next fire()
+        await asyncio.sleep(self.settle_s)
+        print(f"[Lighter] Connected to {self.port} at {self.baudrate} baud")
+        return True
+
+    def _on_readable(self):
+        try:
+            data = self._serial.read(self._serial.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:
+            print(f"[Lighter] Lost {self.port}: {e}")
+            self._disconnect()
+            return
+        if data:
+            self._received.put_nowait((time.perf_counter(), data))
+
+    def _poll(self):
+        try:
+            waiting = self._serial.in_waiting
+        except (serial.SerialException, OSError) as e:
+            print(f"[Lighter] Lost {self.port}: {e}")
+            self._disconnect()
+            return
+        if waiting:
+            self._on_readable()
+        if self._serial is not None:
+            self._poll_handle = self._loop.call_later(self.poll_interval, self._poll)
+
+    def _disconnect(self):
+        if self._serial is None:
+            return
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+            self._poll_handle = None
+        try:
+            self._serial.close()
+        except (serial.SerialException, OSError):
+            pass
+        self._serial = None
+
+    async def _reconnect(self) -> bool:
+        for attempt in range(1, self.reconnect_attempts + 1):
+            self._disconnect()
+            if await self.connect():
+                self.reconnects += 1
+                return True
+            print(f"[Lighter] Reconnect attempt {attempt}/{self.reconnect_attempts} failed")
+            await asyncio.sleep(self.reconnect_delay_s)
+        return False
+
+    async def fire(self) -> bool:
+        """
+        Sends the fire command. Returns True once it is written; waits up to
+        `ack_timeout_s` for the firmware's answer to record the round trip.
+        """
+        async with self._lock:
+            for _ in range(2):
+                if not self.connected and not await self._reconnect():
+                    return False
+                # Drop anything left over from before this command
+                while not self._received.empty():
+                    self._received.get_nowait()
+                started = time.perf_counter()
+                try:
+                    self._serial.write(self.fire_command)
+                    self._serial.flush()
+                except (serial.SerialException, OSError) as e:
+                    print(f"[Lighter] Write failed: {e}")
+                    self._disconnect()
+                    continue
+                written = time.perf_counter()
+                self.fires += 1
+                self.write_latencies.append(written - started)
+                try:
+                    acked_at, _ = await asyncio.wait_for(self._received.get(), self.ack_timeout_s)
+                    self.acks += 1
+                    self.ack_latencies.append(acked_at - started)
+                    print(f"[Lighter] Fired, written in {(written - started) * 1000:.2f} ms, "
+                          f"acknowledged in {(acked_at - started) * 1000:.2f} ms")
+                except asyncio.TimeoutError:
+                    print(f"[Lighter] Fired, written in {(written - started) * 1000:.2f} ms, no acknowledgement")
+                return True
+            return False
+
+    def stats(self) -> str:
+        return (f"{self.fires} fires, {self.acks} acknowledged, {self.reconnects} reconnects, "
+                f"write p50 {_percentile(self.write_latencies, 0.5) * 1000:.2f} ms "
+                f"p99 {_percentile(self.write_latencies, 0.99) * 1000:.2f} ms, "
+                f"ack p50 {_percentile(self.ack_latencies, 0.5) * 1000:.2f} ms "
+                f"p99 {_percentile(self.ack_latencies, 0.99) * 1000:.2f} ms")
+
+    async def close(self):
+        async with self._lock:
+            self._disconnect()
+
+
+class PtyStandIn:
+    """
+    Pseudo-terminal pretending to be the relay board: answers every fire
+    command with "OK\\n" after `delay_s`. Connect a LighterController to `path`.
+    """
+    def __init__(self, fire_command: bytes = b'1', delay_s: float = 0.0):
+        self.fire_command = fire_command
+        self.delay_s = delay_s
+        self.master, self._slave = os.openpty()
+        self.path = os.ttyname(self._slave)
+        self.received = 0
+
+    def start(self):
+        os.set_blocking(self.master, False)
+        asyncio.get_running_loop().add_reader(self.master, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.master, 1024)
+        except OSError:
+            return
+        for byte in data:
+            if bytes([byte]) == self.fire_command:
+                self.received += 1
+                asyncio.get_running_loop().call_later(self.delay_s, os.write, self.master, b"OK\n")
+
+    def close(self):
+        asyncio.get_running_loop().remove_reader(self.master)
+        os.close(self.master)
+        os.close(self._slave)
+
+
+async def _standin_demo(count: int, delay_s: float):
+    standin = PtyStandIn(delay_s=delay_s)
+    standin.start()
+    lighter = LighterController(standin.path, settle_s=0.0)
+    await lighter.connect()
+    for _ in range(count):
+        await lighter.fire()
+        await asyncio.sleep(0.01)
+    print(f"[Lighter] {lighter.stats()}")
+    await lighter.close()
+    standin.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", default="/dev/ttyACM2")
+    parser.add_argument("--standin", action="store_true", help="Use a pty stand-in instead of the board")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--ack-delay", type=float, default=0.0, help="Stand-in answer delay in seconds")
+    args = parser.parse_args()
+    if args.standin:
+        asyncio.run(_standin_demo(args.count, args.ack_delay))
+    else:
+        async def fire_once():
+            lighter = LighterController(args.port)
+            if await lighter.connect():
+                await lighter.fire()
+                print(f"[Lighter] {lighter.stats()}")
+            await lighter.close()
+        asyncio.run(fire_once())
@@ -0,0 +1,201 @@
+"""
+Warm multi-policy host.
+
+Keeps several ACT policies loaded with the robot and its cameras connected,
+and switches the active one on command instead of starting a new
+`lerobot-record` per phase. A switch is picked up at the start of the next
+control tick, so it takes at most one tick.
+
+    uv run policy_host.py --robot.type=so100_follower --robot.port=/dev/ttyACM2 ... \
+        --policies='{candle: gyger/act-candle-cake, lighter: gyger/act_lightcandle_refined}' \
+        --tasks='{candle: "Grab the candle and place it into the cake.", lighter: "Light the candle."}'
+
+Commands are read line by line from stdin: a policy name to switch to it,
+"idle" to hold the arm, "quit" to stop. bash_control.sh starts it through
+`just host-policies` and writes the phases decide_next picks to its stdin.
+"""
+import logging
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from lerobot.cameras.opencv.configuration_opencv import OpenCVCameraConfig  # noqa: F401
+from lerobot.configs import parser
+from lerobot.configs.policies import PreTrainedConfig
+from lerobot.datasets.utils import build_dataset_frame
+from lerobot.policies.pretrained import PreTrainedPolicy
+from lerobot.policies.utils import make_robot_action
+from lerobot.processor import PolicyProcessorPipeline, make_default_processors
+from lerobot.robots import (  # noqa: F401
+    Robot,
+    RobotConfig,
+    make_robot_from_config,
+    so100_follower,
+    so101_follower,
+)
+from lerobot.utils.constants import OBS_STR
+from lerobot.utils.control_utils import predict_action
+from lerobot.utils.utils import get_safe_torch_device, init_logging
+
+from inference import load_pretrained, robot_features
+from prefetch import TickStats, sleep_until
+
+
+@dataclass
+class PolicyHostConfig:
+    robot: RobotConfig
+    # Policy name -> pretrained path or hub repo id
+    policies: dict[str, str] = field(default_factory=dict)
+    # Policy name -> task string given to the policy
+    tasks: dict[str, str] = field(default_factory=dict)
+    fps: int = 30
+    # Policy to start with, None waits for a command
+    initial: str | None = None
+
+
+@dataclass
+class LoadedPolicy:
+    name: str
+    task: str
+    policy: PreTrainedPolicy
+    preprocessor: PolicyProcessorPipeline
+    postprocessor: PolicyProcessorPipeline
+
+    def reset(self):
+        self.policy.reset()
+        self.preprocessor.reset()
+        self.postprocessor.reset()
+
+
+def load_policy(name: str, path: str, task: str) -> LoadedPolicy:
+    cfg = PreTrainedConfig.from_pretrained(path)
+    cfg.pretrained_path = path
+    return LoadedPolicy(name, task, *load_pretrained(cfg))
+
+
+class PolicyHost:
+    """
+    Runs the control loop for whichever loaded policy is active.
+    `switch` may be called from any thread; the loop applies it at the top
+    of the next tick.
+    """
+    def __init__(self, robot: Robot, policies: dict[str, LoadedPolicy], fps: int = 30):
+        self.robot = robot
+        self.policies = policies
+        self.fps = fps
+        self.robot_action_processor, self.robot_observation_processor = make_default_processors()[1:]
+        self.features = robot_features(robot, self.robot_action_processor, self.robot_observation_processor)
+        self.active: LoadedPolicy | None = None
+        self._pending: tuple[str | None, float] | None = None
+        self._lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.switch_latencies: list[float] = []
+        self.tick_stats = TickStats(fps)
+
+    def switch(self, name: str | None):
+        """Makes `name` the active policy from the next tick on. None holds the arm."""
+        if name is not None and name not in self.policies:
+            raise KeyError(f"Unknown policy '{name}', loaded: {', '.join(self.policies)}")
+        with self._lock:
+            self._pending = (name, time.perf_counter())
+
+    def _apply_pending_switch(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        name, requested_at = pending
+        self.active = self.policies[name] if name is not None else None
+        if self.active is not None:
+            # Drop the previous episode's action chunk
+            self.active.reset()
+        latency = time.perf_counter() - requested_at
+        self.switch_latencies.append(latency)
+        logging.info(f"[PolicyHost] Switched to {name or 'idle'} in {latency * 1000:.1f} ms")
+
+    def _predict(self, loaded: LoadedPolicy, obs: dict[str, Any]):
+        obs_processed = self.robot_observation_processor(obs)
+        observation_frame = build_dataset_frame(self.features, obs_processed, prefix=OBS_STR)
+        action_values = predict_action(
+            observation=observation_frame,
+            policy=loaded.policy,
+            device=get_safe_torch_device(loaded.policy.config.device),
+            preprocessor=loaded.preprocessor,
+            postprocessor=loaded.postprocessor,
+            use_amp=loaded.policy.config.use_amp,
+            task=loaded.task,
+            robot_type=self.robot.robot_type,
+        )
+        return make_robot_action(action_values, self.features)
+
+    def warm_up(self):
+        """One inference per policy, so the first real tick after a switch is not slow."""
+        obs = self.robot.get_observation()
+        for loaded in self.policies.values():
+            start = time.perf_counter()
+            self._predict(loaded, obs)
+            loaded.reset()
+            logging.info(f"[PolicyHost] Warmed up {loaded.name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def run(self):
+        next_tick_t = time.perf_counter()
+        while not self.stop_event.is_set():
+            start_loop_t = time.perf_counter()
+            self._apply_pending_switch()
+            # Keep reading while idle, so cameras stay streaming
+            obs = self.robot.get_observation()
+            if self.active is not None:
+                action = self._predict(self.active, obs)
+                self.robot.send_action(self.robot_action_processor((action, obs)))
+            end_loop_t = time.perf_counter()
+            self.tick_stats.tick(next_tick_t, start_loop_t, end_loop_t)
+            next_tick_t = self.tick_stats.next_deadline(next_tick_t, end_loop_t)
+            sleep_until(next_tick_t)
+
+    def stats(self) -> str:
+        if not self.switch_latencies:
+            return "no switches"
+        ordered = sorted(self.switch_latencies)
+        return (f"{len(ordered)} switches, median {ordered[len(ordered) // 2] * 1000:.1f} ms, "
+                f"max {ordered[-1] * 1000:.1f} ms (tick {1000 / self.fps:.1f} ms)")
+
+
+@parser.wrap()
+def host(cfg: PolicyHostConfig):
+    init_logging()
+    robot = make_robot_from_config(cfg.robot)
+    policies = {
+        name: load_policy(name, path, cfg.tasks.get(name, ""))
+        for name, path in cfg.policies.items()
+    }
+    robot.connect()
+    policy_host = PolicyHost(robot, policies, fps=cfg.fps)
+    policy_host.warm_up()
+    if cfg.initial is not None:
+        policy_host.switch(cfg.initial)
+    loop = threading.Thread(target=policy_host.run, daemon=True)
+    loop.start()
+    print(f"[PolicyHost] Ready with {', '.join(policies)}", flush=True)
+    try:
+        for line in sys.stdin:
+            command = line.strip()
+            if not command:
+                continue
+            if command == "quit":
+                break
+            try:
+                policy_host.switch(None if command == "idle" else command)
+            except KeyError as e:
+                print(f"[PolicyHost] {e}", flush=True)
+    finally:
+        policy_host.stop_event.set()
+        loop.join()
+        robot.disconnect()
+        print(f"[PolicyHost] {policy_host.stats()}", flush=True)
+        print(f"[PolicyHost] {policy_host.tick_stats.stats()}", flush=True)
+
+
+if __name__ == "__main__":
+    host()
@@ -0,0 +1,327 @@
+"""
+Observation prefetch and tick timing for the policy control loop.
+
+`robot.get_observation()` reads the motor bus and then every camera one
+after the other, so a tick starts with tens of milliseconds of waiting. Here
+each camera gets a reader thread that keeps its two newest frames (double
+buffering); a tick only reads the motor positions and picks, per camera, the
+buffered frame closest to a common reference time. Nothing waits on a
+camera. The spread of the chosen timestamps is only measured, ticks over
+`skew_alert_s` are counted: free-running cameras are out of phase, so three
+at 30 fps can be 20 ms apart at best, and waiting for a better set of frames
+would cost the tick more than the skew does.
+
+`TickStats` records how late every tick started against a fixed-rate
+schedule and how many ticks overran their period. `sleep_until` waits for a
+tick's absolute start time: it sleeps until `spin_s` before it and spins only
+for the rest, so the loop does not hold a core for the whole tick.
+
+    python prefetch.py --bench
+    python prefetch.py --bench-wait
+"""
+import argparse
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Default time spun before a deadline; sleep() on Linux wakes up 50-100 us late
+SPIN_S = 0.0005
+
+# Upper edges of the jitter histogram buckets, in seconds
+JITTER_BUCKETS = (50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2e-3, 5e-3)
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def sleep_until(deadline: float, spin_s: float = SPIN_S) -> float:
+    """
+    Waits until `time.perf_counter()` reaches `deadline`. Sleeps until `spin_s`
+    before it and spins for the rest. Returns how late it returned.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin_s:
+        time.sleep(remaining - spin_s)
+    while time.perf_counter() < deadline:
+        pass
+    return time.perf_counter() - deadline
+
+
+def jitter_histogram(samples: List[float]) -> str:
+    """Counts per bucket of JITTER_BUCKETS, e.g. '<50us 812 | <100us 40 | ...'."""
+    counts = [0] * (len(JITTER_BUCKETS) + 1)
+    for sample in samples:
+        counts[next((i for i, edge in enumerate(JITTER_BUCKETS) if sample < edge), len(JITTER_BUCKETS))] += 1
+    labels = [f"<{edge * 1e6:.0f}us" if edge < 1e-3 else f"<{edge * 1e3:.0f}ms" for edge in JITTER_BUCKETS]
+    labels.append(f">={JITTER_BUCKETS[-1] * 1e3:.0f}ms")
+    return " | ".join(f"{label} {count}" for label, count in zip(labels, counts) if count)
+
+
+class CameraBuffer:
+    """
+    Reads one camera continuously in a background thread. `read` is the
+    camera's blocking read of the next frame, e.g. lerobot's `Camera.read`.
+    """
+    def __init__(self, name: str, read: Callable[[], np.ndarray], depth: int = 2):
+        self.name = name
+        self._read = read
+        # (time.perf_counter() when the frame arrived, frame), newest last
+        self.frames = deque(maxlen=depth)
+        self.frames_read = 0
+        self.errors = 0
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"prefetch-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                frame = self._read()
+            except Exception as e:
+                self.errors += 1
+                if self.errors == 1:
+                    print(f"[Prefetch] Camera {self.name} read failed: {e}")
+                time.sleep(0.01)
+                continue
+            arrived = time.perf_counter()
+            with self._lock:
+                self.frames.append((arrived, frame))
+                self.frames_read += 1
+            self.ready.set()
+
+    def snapshot(self) -> List[Tuple[float, np.ndarray]]:
+        with self._lock:
+            return list(self.frames)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+
+class ObservationPrefetcher:
+    """
+    Builds observations like `robot.get_observation()` from `read_state` (the
+    motor positions, read on the calling thread) and the buffered frames of
+    `cameras` (name -> blocking read function). Observations whose frames
+    are more than `skew_alert_s` apart are counted, not held back.
+    """
+    def __init__(self, read_state: Callable[[], Dict[str, Any]],
+                 cameras: Dict[str, Callable[[], np.ndarray]],
+                 skew_alert_s: float = 0.02, depth: int = 2):
+        self.read_state = read_state
+        self.buffers = {name: CameraBuffer(name, read, depth) for name, read in cameras.items()}
+        self.skew_alert_s = skew_alert_s
+        self.skews: List[float] = []
+        self.ages: List[float] = []
+        self.skews_over_alert = 0
+        self.repeats = 0
+        self._last: Dict[str, float] = {}
+
+    @classmethod
+    def for_robot(cls, robot, **kwargs) -> "ObservationPrefetcher":
+        """Prefetcher for a lerobot follower arm with a motor bus and cameras."""
+        def read_state():
+            positions = robot.bus.sync_read("Present_Position")
+            return {f"{motor}.pos": value for motor, value in positions.items()}
+        cameras = {name: camera.read for name, camera in robot.cameras.items()}
+        return cls(read_state, cameras, **kwargs)
+
+    def start(self, timeout_s: float = 5.0):
+        """Starts the reader threads and waits for a first frame from each."""
+        for buffer in self.buffers.values():
+            buffer.start()
+        deadline = time.perf_counter() + timeout_s
+        for buffer in self.buffers.values():
+            if not buffer.ready.wait(max(0.0, deadline - time.perf_counter())):
+                raise TimeoutError(f"No frame from camera {buffer.name} after {timeout_s:.1f}s")
+
+    def stop(self):
+        for buffer in self.buffers.values():
+            buffer.stop()
+
+    def _align(self) -> Dict[str, Tuple[float, np.ndarray]]:
+        snapshots = {name: buffer.snapshot() for name, buffer in self.buffers.items()}
+        # The slowest camera's newest frame is the newest moment every camera has seen
+        reference = min(frames[-1][0] for frames in snapshots.values())
+        return {
+            name: min(frames, key=lambda item: abs(item[0] - reference))
+            for name, frames in snapshots.items()
+        }
+
+    def get_observation(self) -> Dict[str, Any]:
+        obs = self.read_state()
+        if not self.buffers:
+            return obs
+        now = time.perf_counter()
+        chosen = self._align()
+        stamps = [arrived for arrived, _ in chosen.values()]
+        skew = max(stamps) - min(stamps)
+        self.skews.append(skew)
+        self.ages.append(now - min(stamps))
+        if skew > self.skew_alert_s:
+            self.skews_over_alert += 1
+        for name, (arrived, frame) in chosen.items():
+            if self._last.get(name) == arrived:
+                # The camera has not delivered a new frame since the last tick
+                self.repeats += 1
+            self._last[name] = arrived
+            obs[name] = frame
+        return obs
+
+    def stats(self) -> str:
+        if not self.skews:
+            return "no observations"
+        return (f"{len(self.skews)} observations, camera skew p50 {_percentile(self.skews, 0.5) * 1000:.1f} ms "
+                f"p99 {_percentile(self.skews, 0.99) * 1000:.1f} ms "
+                f"({self.skews_over_alert} over {self.skew_alert_s * 1000:.0f} ms), "
+                f"frame age p50 {_percentile(self.ages, 0.5) * 1000:.1f} ms, {self.repeats} repeated frames")
+
+
+class TickStats:
+    """Start jitter and overruns of a fixed-rate loop against its schedule."""
+    def __init__(self, fps: float):
+        self.period = 1.0 / fps
+        self.fps = fps
+        self.jitter: List[float] = []
+        self.durations: List[float] = []
+        self.overruns = 0
+        self.skipped = 0
+
+    def tick(self, scheduled: float, started: float, finished: float):
+        self.jitter.append(started - scheduled)
+        self.durations.append(finished - started)
+
+    def next_deadline(self, scheduled: float, now: float) -> float:
+        """
+        Start of the next tick. An overrun skips the slots it used up instead
+        of running late ticks back to back to catch up.
+        """
+        deadline = scheduled + self.period
+        if now > deadline:
+            self.overruns += 1
+            missed = int((now - deadline) / self.period) + 1
+            self.skipped += missed
+            deadline += missed * self.period
+        return deadline
+
+    def stats(self) -> str:
+        if not self.jitter:
+            return "no ticks"
+        return (f"{len(self.jitter)} ticks at {self.fps:.0f} fps, start jitter "
+                f"p50 {_percentile(self.jitter, 0.5) * 1000:.2f} ms p99 {_percentile(self.jitter, 0.99) * 1000:.2f} ms "
+                f"max {max(self.jitter) * 1000:.2f} ms, tick p50 {_percentile(self.durations, 0.5) * 1000:.1f} ms "
+                f"p99 {_percentile(self.durations, 0.99) * 1000:.1f} ms, "
+                f"{self.overruns} overruns ({self.skipped} slots skipped); "
+                f"jitter histogram: {jitter_histogram(self.jitter)}")
+
+
+def _bench(seconds: float, fps: float):
+    """Serial reads vs prefetch with stand-in cameras delivering at 30 fps."""
+    class StandInCamera:
+        def __init__(self, shape, fps, offset):
+            self.image = np.zeros(shape, dtype=np.uint8)
+            self.period = 1.0 / fps
+            self.next = time.perf_counter() + offset
+
+        def read(self):
+            # Blocks until the next frame is due, like a V4L2 read
+            self.next = max(self.next + self.period, time.perf_counter())
+            time.sleep(max(0.0, self.next - time.perf_counter()))
+            return self.image
+
+    def cameras():
+        return {"fpv": StandInCamera((768, 1024, 3), 30, 0.0).read,
+                "top": StandInCamera((720, 1280, 3), 30, 0.011).read,
+                "side": StandInCamera((480, 640, 3), 30, 0.023).read}
+
+    def read_state():
+        time.sleep(0.003)  # a sync_read on the motor bus
+        return {"shoulder_pan.pos": 0.0}
+
+    def run(get_observation):
+        stats = TickStats(fps)
+        end = time.perf_counter() + seconds
+        scheduled = time.perf_counter()
+        while scheduled < end:
+            sleep_until(scheduled)
+            started = time.perf_counter()
+            get_observation()
+            time.sleep(0.008)  # inference
+            finished = time.perf_counter()
+            stats.tick(scheduled, started, finished)
+            scheduled = stats.next_deadline(scheduled, finished)
+        return stats
+
+    serial_cameras = cameras()
+    serial = run(lambda: {**read_state(), **{n: read() for n, read in serial_cameras.items()}})
+    print(f"[Prefetch] serial reads: {serial.stats()}")
+    prefetcher = ObservationPrefetcher(read_state, cameras())
+    prefetcher.start()
+    try:
+        prefetched = run(prefetcher.get_observation)
+    finally:
+        prefetcher.stop()
+    print(f"[Prefetch] prefetched:   {prefetched.stats()}")
+    print(f"[Prefetch] {prefetcher.stats()}")
+
+
+def _bench_wait(seconds: float, fps: float, spin_s: float):
+    """CPU use and start jitter of a fixed-rate loop for three ways of waiting."""
+    def spin(deadline):
+        while time.perf_counter() < deadline:
+            pass
+
+    def relative_sleep(deadline):
+        # What a loop that sleeps for `period - elapsed` does
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    waits = {
+        "spin": spin,
+        "sleep": relative_sleep,
+        f"hybrid ({spin_s * 1e6:.0f} us spin)": lambda deadline: sleep_until(deadline, spin_s),
+    }
+    for name, wait in waits.items():
+        stats = TickStats(fps)
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        scheduled = wall_start
+        while scheduled < wall_start + seconds:
+            wait(scheduled)
+            started = time.perf_counter()
+            time.sleep(0.008)  # inference on the GPU
+            finished = time.perf_counter()
+            stats.tick(scheduled, started, finished)
+            scheduled = stats.next_deadline(scheduled, finished)
+        cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+        print(f"[Prefetch] {name}: CPU {cpu * 100:.1f}% of a core, {stats.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bench", action="store_true", help="Compare serial reads with prefetch")
+    parser.add_argument("--bench-wait", action="store_true", help="Compare spinning, sleeping and hybrid waits")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--spin-s", type=float, default=SPIN_S, help="Time spun before each deadline")
+    args = parser.parse_args()
+    if args.bench:
+        _bench(args.seconds, args.fps)
+    elif args.bench_wait:
+        _bench_wait(args.seconds, args.fps, args.spin_s)
+    else:
+        parser.print_help()
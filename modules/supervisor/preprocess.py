@@ -0,0 +1,134 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from frame import Frame
+from tracing import tracer
+
+
+def scaled_size(size, long_side):
+    """(width, height) scaled so the longer side is `long_side`, never upscaled."""
+    width, height = size
+    scale = min(1.0, long_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+@dataclass
+class PreparedUpload:
+    images: List[bytes]  # JPEGs to send, in order
+    roi: List[float]  # [y0, x0, y1, x1] of the crop in full-frame 0-1000 coordinates
+    sizes: List[tuple] = field(default_factory=list)
+    prompt_hint: Optional[str] = None
+    # True when the model answers in crop coordinates and points need mapping back
+    points_in_crop: bool = False
+
+    @property
+    def bytes_total(self) -> int:
+        return sum(len(image) for image in self.images)
+
+    def map_points(self, result):
+        """Maps a VisionResult's points from crop to full-frame 0-1000 coordinates, in place."""
+        if not self.points_in_crop or result is None or not len(result.points):
+            return result
+        y0, x0, y1, x1 = self.roi
+        origin = np.array([y0, x0], dtype=np.float32)
+        scale = np.array([(y1 - y0) / 1000, (x1 - x0) / 1000], dtype=np.float32)
+        result.points = origin + result.points * scale
+        return result
+
+
+def points_roi(points, margin: float):
+    """Bounding box around the returned [y, x] points plus `margin`, in 0-1000 coordinates."""
+    if points is None or not len(points):
+        return None
+    y_min, x_min = points.min(axis=0)
+    y_max, x_max = points.max(axis=0)
+    return [max(0, float(y_min) - margin), max(0, float(x_min) - margin),
+            min(1000, float(y_max) + margin), min(1000, float(x_max) + margin)]
+
+
+class UploadPreprocessor:
+    """
+    Shrinks what is uploaded to the vision model.
+
+    Crops the frame to the workspace ROI, then downscales so the long side is
+    at most `long_side`. With `follow_points` the crop also covers a box around
+    the last returned points: together with the configured `roi` when there is
+    one (the crop is never smaller than it), on its own otherwise. After an
+    answer without points, and every `refresh_every` uploads, the crop goes
+    back to the workspace ROI (or the full frame), so objects outside the
+    last box are seen again. In `dual` mode it sends a low-res full frame
+    followed by a high-res crop instead, and asks for points on the full frame.
+    """
+    def __init__(self, roi=None, long_side: int = 768, crop_long_side: int = 1024,
+                 follow_points: bool = True, margin: float = 150,
+                 min_roi_size: float = 300, dual: bool = False,
+                 jpeg_quality: int = 90, refresh_every: int = 5):
+        self.roi = roi
+        self.long_side = long_side
+        self.crop_long_side = crop_long_side
+        self.follow_points = follow_points
+        self.margin = margin
+        self.min_roi_size = min_roi_size
+        self.dual = dual
+        self.jpeg_quality = jpeg_quality
+        self.refresh_every = refresh_every
+        # Uploads cropped around points since the last workspace-sized one
+        self._followed = 0
+
+    def _roi(self, last_points) -> List[float]:
+        workspace = self.roi or [0, 0, 1000, 1000]
+        roi = points_roi(last_points, self.margin) if self.follow_points else None
+        if roi is None or self._followed >= self.refresh_every:
+            self._followed = 0
+            return list(workspace)
+        self._followed += 1
+        if self.roi is not None:
+            # The configured workspace is the smallest crop, points can only widen it
+            roi = [min(roi[0], workspace[0]), min(roi[1], workspace[1]),
+                   max(roi[2], workspace[2]), max(roi[3], workspace[3])]
+        # Grow tiny boxes so the model still sees some context
+        y0, x0, y1, x1 = roi
+        grow_y = max(0, self.min_roi_size - (y1 - y0)) / 2
+        grow_x = max(0, self.min_roi_size - (x1 - x0)) / 2
+        return [max(0, y0 - grow_y), max(0, x0 - grow_x),
+                min(1000, y1 + grow_y), min(1000, x1 + grow_x)]
+
+    def _encode(self, image, long_side: int):
+        height, width = image.shape[:2]
+        size = scaled_size((width, height), long_side)
+        if size != (width, height):
+            with tracer.span("resize", size=size):
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        with tracer.span("jpeg_encode", size=size):
+            ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("Could not encode upload image")
+        return buf.tobytes(), size
+
+    def prepare(self, frame: Frame, last_points=None) -> PreparedUpload:
+        roi = self._roi(last_points)
+        height, width = frame.image.shape[:2]
+        y0, x0, y1, x1 = roi
+        crop = frame.image[int(y0 * height / 1000):int(y1 * height / 1000),
+                           int(x0 * width / 1000):int(x1 * width / 1000)]
+        full_frame = roi == [0, 0, 1000, 1000]
+
+        if self.dual and not full_frame:
+            overview, overview_size = self._encode(frame.image, self.long_side)
+            detail, detail_size = self._encode(crop, self.crop_long_side)
+            hint = (
+                "The first image is the full scene. The second image is a close-up of "
+                f"the region [{y0:.0f}, {x0:.0f}, {y1:.0f}, {x1:.0f}] ([y0, x0, y1, x1], "
+                "normalized to 0-1000) of the first image. Return all points in the "
+                "coordinates of the first image."
+            )
+            return PreparedUpload([overview, detail], roi, [overview_size, detail_size], hint)
+
+        if full_frame and max(width, height) <= self.long_side:
+            # Nothing to crop or shrink, reuse the frame's own JPEG
+            return PreparedUpload([frame.jpeg_bytes], roi, [(width, height)])
+        image, size = self._encode(crop, self.long_side)
+        return PreparedUpload([image], roi, [size], points_in_crop=not full_frame)
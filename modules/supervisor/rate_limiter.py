@@ -0,0 +1,168 @@
+"""
+Priority token bucket in front of the vision backend.
+
+Every request takes a token. Tokens refill at `calls_per_minute`, up to
+`burst`, and a run gets at most `run_budget` of them. Waiting requests are
+served by priority (safety before transition before routine), oldest first
+within a class, and the lower classes leave a few tokens in the bucket so a
+safety check never waits behind routine ones. A request that could no longer
+be answered before its deadline is dropped instead of spending a token.
+"""
+import asyncio
+import heapq
+import itertools
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+
+class Priority(IntEnum):
+    SAFETY = 0      # e.g. is the flame lit, stop the lighter
+    TRANSITION = 1  # checks that can advance the FSM
+    ROUTINE = 2     # perception polls, e.g. while idle
+
+
+class Dropped(Exception):
+    """The request was not sent: its deadline cannot be met or the budget is spent."""
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    future: asyncio.Future = field(compare=False)
+    # Loop time after which an answer would come too late
+    latest_start: float = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class VisionRateLimiter:
+    def __init__(self, calls_per_minute: float = 60.0, burst: int = 6,
+                 run_budget: Optional[int] = None,
+                 reserve: Optional[Dict[Priority, int]] = None):
+        self.rate = calls_per_minute / 60.0
+        self.burst = burst
+        self.run_budget = run_budget
+        # Tokens each class must leave in the bucket for the ones above it
+        self.reserve = reserve if reserve is not None else {
+            Priority.SAFETY: 0, Priority.TRANSITION: 1, Priority.ROUTINE: 2,
+        }
+        self.tokens = float(burst)
+        self.granted = 0
+        self.dropped: Dict[Priority, int] = {p: 0 for p in Priority}
+        self.waits: Dict[Priority, List[float]] = {p: [] for p in Priority}
+        self.max_queue_depth = 0
+        # Round trip of recent requests, to tell whether a queued one can still make it
+        self.latency_s = 0.0
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refilled_at: Optional[float] = None
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for w in self._queue if not w.future.done())
+
+    def record_latency(self, seconds: float):
+        # Exponential moving average, like CheckScheduler
+        self.latency_s = seconds if self.latency_s == 0 else 0.7 * self.latency_s + 0.3 * seconds
+
+    async def acquire(self, priority: Priority, deadline_s: Optional[float] = None) -> float:
+        """
+        Waits for a token. `deadline_s` is the time from now by which the answer
+        is needed. Returns the time spent waiting, raises Dropped if the request
+        should not be sent.
+        """
+        self._loop = asyncio.get_running_loop()
+        now = self._loop.time()
+        self._refill(now)
+        latest_start = now + deadline_s - self.latency_s if deadline_s is not None else float("inf")
+        if latest_start < now:
+            self._drop(priority, "answers take longer than its deadline")
+        waiter = _Waiter(priority, next(self._seq), self._loop.create_future(), latest_start, now)
+        heapq.heappush(self._queue, waiter)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # Give the place in the queue (or the token just granted) back
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.tokens += 1
+                self.granted -= 1
+            raise
+        finally:
+            self._dispatch()
+        waited = self._loop.time() - now
+        self.waits[priority].append(waited)
+        return waited
+
+    def _drop(self, priority: Priority, reason: str):
+        self.dropped[priority] += 1
+        print(f"[RateLimiter] Dropped a {priority.name.lower()} request: {reason}")
+        raise Dropped(reason)
+
+    def _refill(self, now: float):
+        # A new event loop (e.g. the next simulated run) restarts the clock
+        if self._refilled_at is not None and now >= self._refilled_at:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        now = self._loop.time()
+        self._refill(now)
+        for waiter in self._queue:
+            if not waiter.future.done() and now > waiter.latest_start:
+                self.dropped[Priority(waiter.priority)] += 1
+                print(f"[RateLimiter] Dropped a {Priority(waiter.priority).name.lower()} request: "
+                      f"waited {now - waiter.enqueued_at:.1f}s, too late for its deadline")
+                waiter.future.set_exception(Dropped("deadline passed while queued"))
+        next_wake = float("inf")
+        while self._queue:
+            waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if self.run_budget is not None and self.granted >= self.run_budget:
+                heapq.heappop(self._queue)
+                self.dropped[Priority(waiter.priority)] += 1
+                waiter.future.set_exception(Dropped(f"run budget of {self.run_budget} calls spent"))
+                continue
+            needed = 1 + self.reserve.get(Priority(waiter.priority), 0)
+            if self.tokens >= needed:
+                heapq.heappop(self._queue)
+                self.tokens -= 1
+                self.granted += 1
+                waiter.future.set_result(None)
+                continue
+            # The head of the queue waits for the bucket; nobody behind it may overtake
+            next_wake = now + (needed - self.tokens) / self.rate
+            break
+        # Whoever's deadline runs out first still has to be dropped on time
+        for waiter in self._queue:
+            if not waiter.future.done():
+                next_wake = min(next_wake, waiter.latest_start)
+        if next_wake != float("inf"):
+            self._wakeup = self._loop.call_at(max(now, next_wake) + 1e-3, self._dispatch)
+
+    def stats(self) -> str:
+        waits = [w for samples in self.waits.values() for w in samples]
+        per_class = ", ".join(
+            f"{p.name.lower()} {len(self.waits[p])} sent/{self.dropped[p]} dropped "
+            f"wait p50 {_percentile(self.waits[p], 0.5) * 1000:.0f} ms"
+            for p in Priority if self.waits[p] or self.dropped[p]
+        )
+        budget = f"/{self.run_budget}" if self.run_budget is not None else ""
+        return (f"{self.granted}{budget} calls, queue depth {self.queue_depth} (max {self.max_queue_depth}), "
+                f"wait p99 {_percentile(waits, 0.99) * 1000:.0f} ms; {per_class or 'no requests'}")
@@ -0,0 +1,150 @@
+"""
+Tail-latency hedging and a circuit breaker for the vision backend.
+
+`Hedger` keeps a rolling window of answer times. When a request has been
+waiting longer than the window's p90 it fires a duplicate and takes whichever
+answer comes first. `CircuitBreaker` stops sending requests after repeated
+failures and lets a single trial through once the cool-down has passed;
+while it is open the supervisor falls back to its local checks.
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+
+class Hedger:
+    def __init__(self, quantile: float = 0.9, window: int = 50, min_samples: int = 10):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def hedge_after(self) -> Optional[float]:
+        """Seconds after which a duplicate is sent, None until there are enough samples."""
+        if self.quantile <= 0 or len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+
+    async def run(self, call: Callable[[], Awaitable], duplicate: Optional[Callable[[], Awaitable]] = None):
+        """
+        Awaits `call()`, and `duplicate()` (default: `call()` again) as well if
+        the first is slower than `hedge_after`. Returns the first answer and
+        cancels the other; raises the first request's error if neither answers.
+        """
+        loop = asyncio.get_running_loop()
+        self.requests += 1
+        started = {}
+        primary = asyncio.ensure_future(call())
+        started[primary] = loop.time()
+        pending = {primary}
+        errors = {}
+        try:
+            hedge_after = self.hedge_after
+            if hedge_after is not None:
+                done, _ = await asyncio.wait(pending, timeout=hedge_after)
+                if not done:
+                    self.hedged += 1
+                    print(f"[Hedge] No answer after {hedge_after * 1000:.0f} ms (p{self.quantile * 100:.0f}), "
+                          f"sending a duplicate")
+                    second = asyncio.ensure_future((duplicate or call)())
+                    started[second] = loop.time()
+                    pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors[task] = task.exception()
+                        continue
+                    self.latencies.append(loop.time() - started[task])
+                    if task is not primary:
+                        self.hedge_wins += 1
+                    return task.result()
+            raise errors.get(primary) or next(iter(errors.values()))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> str:
+        hedge_after = self.hedge_after
+        threshold = f"{hedge_after * 1000:.0f} ms" if hedge_after is not None else "warming up"
+        return (f"{self.hedged}/{self.requests} requests hedged, duplicate won {self.hedge_wins}, "
+                f"hedge after {threshold}")
+
+
+class CircuitBreaker:
+    """
+    Closed: requests go through. After `failure_threshold` failures in a row
+    it opens for `cooldown_s`, then half-opens and lets one trial request
+    through. A successful trial closes it again, a failed one reopens it with
+    twice the cool-down (up to `max_cooldown_s`).
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 3, cooldown_s: float = 10.0,
+                 max_cooldown_s: float = 120.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown_s = cooldown_s
+        self.cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.short_circuited = 0
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    @property
+    def unavailable(self) -> bool:
+        """True while requests would be refused, without starting a trial."""
+        if self.state == self.OPEN:
+            return self._now() - self.opened_at < self.cooldown_s
+        return self.state == self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """True if a request may go to the backend now."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self._now() - self.opened_at >= self.cooldown_s:
+            self.state = self.HALF_OPEN
+            print("[Breaker] Cool-down over, sending a trial request")
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            print(f"[Breaker] Backend answered, closing after {self._now() - self.opened_at:.1f}s")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown_s = self.base_cooldown_s
+
+    def record_failure(self, reason: str = ""):
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.cooldown_s = min(self.max_cooldown_s, self.cooldown_s * 2)
+            self._open(f"trial failed{': ' + reason if reason else ''}")
+        elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._open(f"{self.failures} failures in a row{', last: ' + reason if reason else ''}")
+
+    def release(self):
+        """A trial request was abandoned without an answer, allow the next one right away."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.opened_at = self._now() - self.cooldown_s
+
+    def _open(self, reason: str):
+        self.state = self.OPEN
+        self.opened_at = self._now()
+        self.trips += 1
+        print(f"[Breaker] Open for {self.cooldown_s:.0f}s ({reason}), using local checks")
+
+    def stats(self) -> str:
+        return f"{self.state}, tripped {self.trips} times, {self.short_circuited} checks served locally"
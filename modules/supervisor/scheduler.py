@@ -0,0 +1,87 @@
+import math
+from typing import Optional
+
+from vision_result import VisionResult
+
+
+class CheckScheduler:
+    """
+    Chooses the time until the next vision check in `monitor_general`.
+
+    The interval shrinks as the returned points show the tool (claw or
+    lighter) closing in on its target (cake or candle), and grows while the
+    scene stays unchanged. It is always kept within the phase latency budget
+    (a success must be seen within `latency_budget_s`, including the time the
+    model takes to answer) and above the interval implied by the maximum call
+    rate.
+    """
+    def __init__(self, phase: str, tool_labels, target_labels, tool_exclude=(),
+                 base_interval: float = 5.0, min_interval: float = 1.0,
+                 max_interval: float = 15.0, latency_budget_s: float = 10.0,
+                 max_calls_per_minute: float = 40.0,
+                 near_distance: float = 80.0, far_distance: float = 400.0,
+                 motion_threshold: float = 15.0, growth: float = 1.5):
+        self.phase = phase
+        self.tool_labels = tool_labels
+        self.target_labels = target_labels
+        self.tool_exclude = tool_exclude
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.latency_budget_s = latency_budget_s
+        self.min_call_spacing = 60.0 / max_calls_per_minute
+        self.near_distance = near_distance
+        self.far_distance = far_distance
+        self.motion_threshold = motion_threshold
+        self.growth = growth
+        self.interval = base_interval
+        self.latency_s = 0.0
+        self._last = None
+
+    def record_latency(self, seconds: float):
+        # Exponential moving average of the vision round trip
+        self.latency_s = seconds if self.latency_s == 0 else 0.7 * self.latency_s + 0.3 * seconds
+
+    def _observation(self, result: Optional[VisionResult]):
+        if result is None:
+            return None, None, None
+        tool = result.find(self.tool_labels, self.tool_exclude)
+        target = result.find(self.target_labels)
+        flags = (result.claw_has_candle, result.is_flame_lit,
+                 result.is_candle_in_cake, result.is_arm_retracted)
+        return tool, target, flags
+
+    def next_interval(self, result: Optional[VisionResult]) -> float:
+        """Returns the seconds to wait before the next check and logs why."""
+        tool, target, flags = self._observation(result)
+        previous = self._last
+        self._last = (tool, target, flags)
+
+        if tool is not None and target is not None:
+            distance = math.dist(tool, target)
+            closeness = (distance - self.near_distance) / (self.far_distance - self.near_distance)
+            closeness = min(1.0, max(0.0, closeness))
+            interval = self.min_interval + closeness * (self.base_interval - self.min_interval)
+            reason = f"{self.tool_labels[0]} is {distance:.0f} from {self.target_labels[0]}"
+            if previous is not None and previous[0] is not None and previous[2] == flags \
+                    and math.dist(previous[0], tool) < self.motion_threshold and closeness > 0:
+                interval = max(interval, self.interval * self.growth)
+                reason += ", scene unchanged"
+        elif previous is not None and previous[2] == flags:
+            interval = self.interval * self.growth
+            reason = "scene unchanged"
+        else:
+            interval = self.base_interval
+            reason = "no usable points"
+
+        # A success must be noticed within the phase budget, answer time included
+        budget = max(self.min_interval, self.latency_budget_s - self.latency_s)
+        if interval > budget:
+            interval, reason = budget, reason + f", capped by {self.latency_budget_s:.0f}s budget"
+        interval = min(interval, self.max_interval)
+        if interval < self.min_call_spacing:
+            interval, reason = self.min_call_spacing, reason + ", capped by max call rate"
+
+        self.interval = interval
+        print(f"[Scheduler][{self.phase}] Next check in {interval:.1f}s ({reason})")
+        return interval
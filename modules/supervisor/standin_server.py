@@ -0,0 +1,188 @@
+"""
+Offline stand-in for the Gemini vision model.
+
+Answers POST /v1/query (the LocalBackend protocol) by replaying recorded
+frame-to-response pairs: the uploaded frame is matched to the recording with
+the nearest perceptual hash. Latency and errors are drawn from configurable
+distributions so the supervisor can be load-tested on a Linux box without the
+network.
+
+    python standin_server.py --images images/ --latency lognormal:1.2,0.35 --error-rate 0.05
+    VISION_BACKEND=local python async_supervisor.py
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from vision_cache import dhash, hamming
+
+# Ground truth for the labeled images in images/
+IMAGE_LABELS = {
+    "idle.jpg": dict(current_state="idle", next_state="place_candle"),
+    "picking_up.jpg": dict(current_state="place_candle", next_state="place_candle",
+                           claw_has_candle=True),
+    "has_candle.jpg": dict(current_state="place_candle", next_state="place_candle",
+                           claw_has_candle=True),
+    "in_cake.jpg": dict(current_state="place_candle", next_state="light_candle",
+                        is_candle_in_cake=True),
+    "in_cake_v2.jpg": dict(current_state="place_candle", next_state="light_candle",
+                           is_candle_in_cake=True),
+    "flame_off_test.jpg": dict(current_state="light_candle", next_state="light_candle",
+                               is_candle_in_cake=True),
+    "flame_on_test.jpg": dict(current_state="light_candle", next_state="retract_arm",
+                              is_candle_in_cake=True, is_flame_lit=True),
+}
+
+
+def labeled_response(fields: dict) -> str:
+    response = {
+        "current_state": "idle",
+        "next_state": "idle",
+        "points": [],
+        "claw_has_candle": False,
+        "is_flame_lit": False,
+        "is_candle_in_cake": False,
+        "is_arm_retracted": False,
+        "instructions": "",
+    }
+    response.update(fields)
+    return json.dumps(response)
+
+
+def load_images(directory: str) -> list:
+    """(hash, response text) pairs for the labeled images found in `directory`."""
+    recordings = []
+    for name, fields in IMAGE_LABELS.items():
+        path = os.path.join(directory, name)
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        recordings.append((dhash(image), labeled_response(fields)))
+    return recordings
+
+
+def load_recordings(path: str) -> list:
+    """(hash, response text) pairs from a JSONL file written by RecordingBackend."""
+    recordings = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recordings.append((int(entry["dhash"], 16), entry["text"]))
+    return recordings
+
+
+def parse_latency(spec: str, rng: random.Random = random):
+    """
+    Returns a sampler for "const:S", "uniform:LO,HI", "normal:MEAN,STD" or
+    "lognormal:MEDIAN,SIGMA" (all in seconds), drawing from `rng`.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if kind == "const":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(np.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+class StandInState:
+    def __init__(self, recordings, latency, error_rate: float, hang_rate: float):
+        self.recordings = recordings
+        self.latency = latency
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def answer(self, image: np.ndarray) -> str:
+        frame_hash = dhash(image)
+        _, text = min(self.recordings, key=lambda r: hamming(r[0], frame_hash))
+        return text
+
+
+def make_handler(state: StandInState):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/query":
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            image = cv2.imdecode(
+                np.frombuffer(base64.b64decode(body["images"][0]), np.uint8),
+                cv2.IMREAD_COLOR,
+            )
+            with state.lock:
+                state.requests += 1
+            roll = random.random()
+            if roll < state.hang_rate:
+                # Simulates a request that never answers in time
+                time.sleep(60)
+            time.sleep(state.latency())
+            if roll < state.hang_rate + state.error_rate:
+                with state.lock:
+                    state.errors += 1
+                self.send_error(503, "Injected error")
+                return
+            payload = json.dumps({"text": state.answer(image)}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--images", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "images"))
+    parser.add_argument("--recordings", nargs="*", default=[],
+                        help="JSONL files written with VISION_RECORD")
+    parser.add_argument("--latency", default="lognormal:1.5,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    recordings = load_images(args.images) if args.images else []
+    for path in args.recordings:
+        recordings += load_recordings(path)
+    if not recordings:
+        raise SystemExit("No recordings to replay")
+    state = StandInState(recordings, parse_latency(args.latency),
+                         args.error_rate, args.hang_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"[StandIn] Replaying {len(recordings)} responses on "
+          f"http://{args.host}:{args.port} (latency {args.latency}, "
+          f"errors {args.error_rate:.0%}, hangs {args.hang_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"[StandIn] {state.requests} requests, {state.errors} injected errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Recursive Bayes filter over the robot's boolean flags.
+
+Each flag (`is_flame_lit`, `is_candle_in_cake`, ...) is a two-state hidden
+Markov model. Between observations the belief drifts according to per-FSM-state
+switching rates (a flame can appear while lighting, hardly ever while placing),
+and every observation is weighed by the reliability of its source (the vision
+model, the local flame detector, the keyboard). Drift alone never raises a
+belief past `max_prior`, and a flag only flips once its posterior crosses a
+decision threshold, so one bad frame moves the belief but not the FSM.
+"""
+import math
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from vision_result import State, VisionResult
+
+FLAGS = ("claw_has_candle", "is_flame_lit", "is_candle_in_cake", "is_arm_retracted")
+
+
+@dataclass
+class SourceModel:
+    # P(source says True | flag is True) and P(source says False | flag is False)
+    sensitivity: float
+    specificity: float
+
+    def likelihoods(self, value: bool) -> Tuple[float, float]:
+        """(P(value | True), P(value | False))"""
+        if value:
+            return self.sensitivity, 1.0 - self.specificity
+        return 1.0 - self.sensitivity, self.specificity
+
+
+# Per second rates (false -> true, true -> false) for each flag, by FSM state
+DEFAULT_RATES: Dict[str, Dict[Optional[State], Tuple[float, float]]] = {
+    "claw_has_candle": {None: (0.01, 0.01), State.PLACE_CANDLE: (0.3, 0.1)},
+    "is_flame_lit": {None: (0.001, 0.01), State.LIGHT_CANDLE: (0.15, 0.01)},
+    "is_candle_in_cake": {None: (0.001, 0.001), State.PLACE_CANDLE: (0.15, 0.01)},
+    "is_arm_retracted": {None: (0.01, 0.1), State.RETRACT_ARM: (0.3, 0.01)},
+}
+
+DEFAULT_PRIORS = {
+    "claw_has_candle": 0.1,
+    "is_flame_lit": 0.01,
+    "is_candle_in_cake": 0.05,
+    "is_arm_retracted": 0.5,
+}
+
+# Highest belief the drift can reach on its own. One vision answer saying True
+# takes 0.5 to 0.89, short of the 0.9 threshold, so it takes two of them; from
+# 0.6 it reaches 0.93, so one is enough
+DEFAULT_MAX_PRIOR = 0.5
+
+DEFAULT_SOURCES: Dict[str, SourceModel] = {
+    "vision": SourceModel(sensitivity=0.85, specificity=0.9),
+    # Only reports when confident, and a bright orange object is rarely a flame
+    "flame_detector": SourceModel(sensitivity=0.95, specificity=0.99),
+    # The operator pressing a key to say the candle is lit
+    "keyboard": SourceModel(sensitivity=0.999, specificity=0.9999),
+}
+
+
+class FlagFilter:
+    """Belief that one flag is True, with hysteresis between two thresholds."""
+    def __init__(self, prior: float, rates: Dict[Optional[State], Tuple[float, float]],
+                 on_threshold: float = 0.9, off_threshold: float = 0.1,
+                 max_prior: float = DEFAULT_MAX_PRIOR):
+        self.p = prior
+        self.rates = rates
+        self.max_prior = max_prior
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.value = prior >= on_threshold
+        self.updated_at: Optional[float] = None
+
+    def predict(self, state: Optional[State], now: float):
+        """
+        Lets the belief drift towards the state's steady state since the last
+        update. The drift does not raise it past `max_prior`, only
+        observations can.
+        """
+        if self.updated_at is not None and now > self.updated_at:
+            rate_on, rate_off = self.rates.get(state, self.rates[None])
+            total = rate_on + rate_off
+            if total > 0:
+                steady = rate_on / total
+                drifted = steady + (self.p - steady) * math.exp(-total * (now - self.updated_at))
+                self.p = min(drifted, max(self.p, self.max_prior))
+        self.updated_at = now
+
+    def update(self, value: bool, source: SourceModel, count: int = 1):
+        """Bayes update with `count` independent observations of `value`."""
+        if_true, if_false = source.likelihoods(value)
+        for _ in range(count):
+            evidence = if_true * self.p + if_false * (1.0 - self.p)
+            self.p = if_true * self.p / evidence
+        self.p = min(1.0 - 1e-6, max(1e-6, self.p))
+        if self.p >= self.on_threshold:
+            self.value = True
+        elif self.p <= self.off_threshold:
+            self.value = False
+
+
+class StateEstimator:
+    """Fuses observations of the flags in FLAGS from every source."""
+    def __init__(self, priors: Optional[Dict[str, float]] = None,
+                 rates: Optional[Dict[str, Dict[Optional[State], Tuple[float, float]]]] = None,
+                 sources: Optional[Dict[str, SourceModel]] = None,
+                 on_threshold: float = 0.9, off_threshold: float = 0.1,
+                 max_prior: float = DEFAULT_MAX_PRIOR):
+        priors = {**DEFAULT_PRIORS, **(priors or {})}
+        rates = {**DEFAULT_RATES, **(rates or {})}
+        self.sources = {**DEFAULT_SOURCES, **(sources or {})}
+        self.filters = {
+            flag: FlagFilter(priors[flag], rates[flag], on_threshold, off_threshold, max_prior)
+            for flag in FLAGS
+        }
+        self.observations = 0
+
+    def advance(self, state: Optional[State], now: float):
+        """Brings every belief up to `now`, e.g. before the FSM changes state."""
+        for flag_filter in self.filters.values():
+            flag_filter.predict(state, now)
+
+    def observe(self, flag: str, value: bool, source: str, state: Optional[State],
+                now: float, count: int = 1) -> bool:
+        """Adds an observation and returns the flag's decided value."""
+        flag_filter = self.filters[flag]
+        flag_filter.predict(state, now)
+        before, decided = flag_filter.p, flag_filter.value
+        flag_filter.update(value, self.sources[source], count)
+        self.observations += 1
+        if flag_filter.value != decided:
+            print(f"[Estimator] {flag} -> {flag_filter.value} "
+                  f"(p {before:.2f} -> {flag_filter.p:.2f}, {source} x{count})")
+        return flag_filter.value
+
+    def observe_result(self, result: VisionResult, state: Optional[State], now: float,
+                       source: str = "vision", count: int = 1) -> Dict[str, bool]:
+        """Adds every flag of a vision answer, returns the decided values."""
+        return {
+            flag: self.observe(flag, getattr(result, flag), source, state, now, count)
+            for flag in FLAGS
+        }
+
+    def probability(self, flag: str) -> float:
+        return self.filters[flag].p
+
+    def value(self, flag: str) -> bool:
+        return self.filters[flag].value
+
+    def __repr__(self):
+        beliefs = ", ".join(f"{flag}={f.p:.2f}" for flag, f in self.filters.items())
+        return f"StateEstimator({beliefs})"
+
+
+if __name__ == "__main__":
+    # Replays vision answers about the flame while lighting: (answer, votes) every
+    # 1.5 s, starting 10 s into the state, the drift cap (0.5 with consensus, 0.6
+    # without, see async_supervisor) and the flag the sequence should end at
+    replays = {
+        "one flipped frame": ([(True, 1)], 0.5, False),
+        "flipped frame after four no's": ([(False, 1)] * 4 + [(True, 1)], 0.5, False),
+        "flipped frame among no's": ([(False, 1), (True, 1), (False, 1)], 0.5, False),
+        "two agreeing frames": ([(True, 1), (True, 1)], 0.5, True),
+        "consensus of two": ([(True, 2)], 0.5, True),
+        "one frame without consensus": ([(True, 1)], 0.6, True),
+        "one frame after a no without consensus": ([(False, 1), (True, 1)], 0.6, False),
+    }
+    correct = 0
+    for name, (answers, max_prior, expected) in replays.items():
+        estimator = StateEstimator(max_prior=max_prior)
+        estimator.advance(State.LIGHT_CANDLE, 0.0)
+        for i, (answer, votes) in enumerate(answers):
+            estimator.observe("is_flame_lit", answer, "vision", State.LIGHT_CANDLE, 10.0 + 1.5 * i, votes)
+        verdict = estimator.value("is_flame_lit")
+        correct += verdict == expected
+        print(f"{name}: lit={verdict} expected={expected} p={estimator.probability('is_flame_lit'):.2f}")
+    print(f"{correct}/{len(replays)} correct")
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Difference hash of a BGR image: downscale to (hash_size + 1) x hash_size
+    grayscale and compare horizontally adjacent pixels. Near-identical frames
+    give hashes that differ in only a few bits.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class VisionCache:
+    """
+    Remembers parsed vision results by perceptual hash of the frame they were
+    computed from. A frame within `max_distance` bits of a cached frame, taken
+    in the same FSM state and within that state's TTL, reuses the cached result.
+    """
+    def __init__(self, max_entries: int = 32, max_distance: int = 4,
+                 ttl_s: float = 10.0, ttl_by_state: Optional[dict] = None):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl_s = ttl_s
+        self.ttl_by_state = ttl_by_state or {}
+        # (state, hash) -> (result, timestamp), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ttl(self, state) -> float:
+        return self.ttl_by_state.get(state, self.ttl_s)
+
+    def lookup(self, frame_hash: int, state, timestamp: float):
+        """Returns the cached result for a similar frame, or None."""
+        best_key, best_distance = None, self.max_distance + 1
+        for key, (result, stored_at) in list(self._entries.items()):
+            if timestamp - stored_at > self.ttl(key[0]):
+                del self._entries[key]
+                continue
+            if key[0] != state:
+                continue
+            distance = hamming(key[1], frame_hash)
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        if best_key is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][0]
+
+    def store(self, frame_hash: int, state, result, timestamp: float):
+        if self.ttl(state) <= 0:
+            return
+        key = (state, frame_hash)
+        self._entries[key] = (result, timestamp)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,241 @@
+import asyncio
+import base64
+import json
+import os
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, Protocol, Union
+
+# google-genai and httpx take most of a second to import, so they are only
+# imported once a backend that needs them is built
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+
+
+class VisionBackend(Protocol):
+    """Anything that can answer a vision query with the model's raw text."""
+    deadline_s: float
+
+    async def query(self, image_bytes: Union[bytes, List[bytes]],
+                    deadline_s: Optional[float] = None,
+                    temperature: Optional[float] = None,
+                    prompt_hint: Optional[str] = None) -> str:
+        ...
+
+
+class BoundedBackend:
+    """
+    Deadline and concurrency handling shared by the backends.
+    Bounds the number of concurrent requests and gives every request a
+    deadline. Cancelling the awaiting task aborts the request.
+    Subclasses implement `_request`.
+    """
+    def __init__(self, prompt: str, temperature: float = 0.5,
+                 max_in_flight: int = 2, deadline_s: float = 15.0):
+        self.prompt = prompt
+        self.temperature = temperature
+        self.deadline_s = deadline_s
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.timeouts = 0
+
+    async def query(self, image_bytes: Union[bytes, List[bytes]],
+                    deadline_s: Optional[float] = None,
+                    temperature: Optional[float] = None,
+                    prompt_hint: Optional[str] = None) -> str:
+        """
+        Sends one JPEG (or several, in order) to the model and returns the raw
+        response text. `prompt_hint` is appended to the prompt.
+        Raises asyncio.TimeoutError if no answer arrives within the deadline,
+        which includes the time spent waiting for a free request slot.
+        """
+        deadline_s = self.deadline_s if deadline_s is None else deadline_s
+        if isinstance(image_bytes, bytes):
+            image_bytes = [image_bytes]
+        prompt = self.prompt if prompt_hint is None else f"{self.prompt}\n{prompt_hint}"
+        temperature = self.temperature if temperature is None else temperature
+        try:
+            return await asyncio.wait_for(
+                self._bounded(image_bytes, temperature, prompt), timeout=deadline_s
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def _bounded(self, images: List[bytes], temperature: float, prompt: str) -> str:
+        async with self._semaphore:
+            return await self._request(images, temperature, prompt)
+
+    async def _request(self, images: List[bytes], temperature: float, prompt: str) -> str:
+        raise NotImplementedError
+
+
+class GeminiBackend(BoundedBackend):
+    """
+    Gemini vision backend.
+    Uses the SDK's async surface so the event loop keeps running while a
+    request is in flight.
+    """
+    def __init__(self, client: "genai.Client", model_id: str, prompt: str,
+                 response_schema: Optional[dict] = None, **kwargs):
+        super().__init__(prompt, **kwargs)
+        self.client = client
+        self.model_id = model_id
+        # When set, the model must answer with JSON matching this schema
+        self.response_schema = response_schema
+
+    def _config(self, temperature: float) -> "types.GenerateContentConfig":
+        from google.genai import types
+        schema = {}
+        if self.response_schema is not None:
+            schema = dict(response_mime_type="application/json",
+                          response_schema=self.response_schema)
+        return types.GenerateContentConfig(
+            temperature=temperature,
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+            **schema,
+        )
+
+    async def _request(self, images: List[bytes], temperature: float, prompt: str) -> str:
+        from google.genai import types
+        contents = [
+            types.Part.from_bytes(data=data, mime_type='image/jpeg')
+            for data in images
+        ]
+        contents.append(prompt)
+        response = await self.client.aio.models.generate_content(
+            model=self.model_id,
+            contents=contents,
+            config=self._config(temperature),
+        )
+        return response.text
+
+
+class LocalBackend(BoundedBackend):
+    """
+    Client for the offline stand-in server (standin_server.py), so the
+    supervisor can run and be load-tested without the network.
+    """
+    def __init__(self, url: str, prompt: str, **kwargs):
+        super().__init__(prompt, **kwargs)
+        self.url = url.rstrip("/")
+        # Imported here, where the backend is built (off the loop at startup),
+        # rather than on the first request
+        import httpx
+        self._http = httpx.AsyncClient(timeout=None)
+
+    async def _request(self, images: List[bytes], temperature: float, prompt: str) -> str:
+        response = await self._http.post(f"{self.url}/v1/query", json={
+            "images": [base64.b64encode(data).decode("ascii") for data in images],
+            "prompt": prompt,
+            "temperature": temperature,
+        })
+        response.raise_for_status()
+        return response.json()["text"]
+
+
+class RecordingBackend:
+    """
+    Wraps a backend and appends every (frame hash, response) pair to a JSONL
+    file that the stand-in server can replay.
+    """
+    def __init__(self, backend: VisionBackend, path: str):
+        self.backend = backend
+        self.path = path
+        self.deadline_s = backend.deadline_s
+
+    async def query(self, image_bytes, deadline_s=None, temperature=None, prompt_hint=None) -> str:
+        import cv2
+        import numpy as np
+        from vision_cache import dhash
+        text = await self.backend.query(image_bytes, deadline_s, temperature, prompt_hint)
+        first = image_bytes if isinstance(image_bytes, bytes) else image_bytes[0]
+        image = cv2.imdecode(np.frombuffer(first, np.uint8), cv2.IMREAD_COLOR)
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"dhash": f"{dhash(image):016x}", "text": text}) + "\n")
+        return text
+
+
+def make_backend(prompt: str, model_id: str, api_key: Optional[str] = None,
+                 **kwargs) -> VisionBackend:
+    """
+    Builds the backend selected by VISION_BACKEND ("gemini", the default, or
+    "local" for the stand-in at VISION_BACKEND_URL). VISION_RECORD=<path>
+    records every answer for later replay.
+    """
+    name = os.getenv("VISION_BACKEND", "gemini")
+    if name == "local":
+        url = os.getenv("VISION_BACKEND_URL", "http://127.0.0.1:8765")
+        kwargs.pop("response_schema", None)
+        backend = LocalBackend(url, prompt, **kwargs)
+    elif name == "gemini":
+        from google import genai
+        backend = GeminiBackend(genai.Client(api_key=api_key), model_id, prompt, **kwargs)
+    else:
+        raise ValueError(f"Unknown VISION_BACKEND '{name}'")
+    record_path = os.getenv("VISION_RECORD")
+    if record_path:
+        backend = RecordingBackend(backend, record_path)
+    return backend
+
+
+def lazy_backend(*args, **kwargs) -> Callable[[], VisionBackend]:
+    """
+    Returns a getter that calls make_backend(*args, **kwargs) on first use and
+    then keeps returning the same backend, so importing a module that has a
+    backend stays cheap.
+    """
+    backend = None
+
+    def get() -> VisionBackend:
+        nonlocal backend
+        if backend is None:
+            backend = make_backend(*args, **kwargs)
+        return backend
+
+    return get
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task that sleeps `interval`.
+    Anything that blocks the loop shows up directly as lag.
+    """
+    def __init__(self, interval: float = 0.05, budget_s: float = 0.05):
+        self.interval = interval
+        self.budget_s = budget_s
+        self.samples = []
+        self.max_lag = 0.0
+        self.violations = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.budget_s:
+                self.violations += 1
+                print(f"[LoopLag] Event loop blocked for {lag * 1000:.0f} ms")
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        print(f"[LoopLag] p50 {self.percentile(0.5) * 1000:.1f} ms, "
+              f"p99 {self.percentile(0.99) * 1000:.1f} ms, "
+              f"max {self.max_lag * 1000:.1f} ms, "
+              f"{self.violations} over the {self.budget_s * 1000:.0f} ms budget")
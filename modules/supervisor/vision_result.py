@@ -0,0 +1,170 @@
+import json
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import List, Optional
+
+import numpy as np
+
+
+class State(Enum):
+    IDLE = "idle"
+    PLACE_CANDLE = "place_candle"
+    LIGHT_CANDLE = "light_candle"
+    RETRACT_ARM = "retract_arm"
+
+
+# Older prompts called the placing phase "pick_up_candle"
+_STATE_ALIASES = {"pick_up_candle": State.PLACE_CANDLE}
+
+
+def parse_state(value) -> State:
+    """Maps the model's state string (value or member name, any case) to a State."""
+    if isinstance(value, State):
+        return value
+    text = str(value).strip().lower()
+    try:
+        return State(text)
+    except ValueError:
+        return _STATE_ALIASES.get(text, State.IDLE)
+
+
+# Response schema sent with every request, so the model has to answer with
+# exactly these fields and types.
+_STATE_SCHEMA = {"type": "STRING", "enum": [s.value for s in State]}
+VISION_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "current_state": _STATE_SCHEMA,
+        "next_state": _STATE_SCHEMA,
+        "points": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "point": {"type": "ARRAY", "items": {"type": "INTEGER"}},
+                    "label": {"type": "STRING"},
+                },
+                "required": ["point", "label"],
+            },
+        },
+        "claw_has_candle": {"type": "BOOLEAN"},
+        "is_flame_lit": {"type": "BOOLEAN"},
+        "is_candle_in_cake": {"type": "BOOLEAN"},
+        "is_arm_retracted": {"type": "BOOLEAN"},
+        "instructions": {"type": "STRING"},
+    },
+    "required": [
+        "current_state", "next_state", "points", "claw_has_candle",
+        "is_flame_lit", "is_candle_in_cake", "is_arm_retracted", "instructions",
+    ],
+}
+
+
+def _empty_points() -> np.ndarray:
+    return np.zeros((0, 2), dtype=np.float32)
+
+
+@dataclass(slots=True)
+class VisionResult:
+    """One parsed answer from the vision model."""
+    current_state: State = State.IDLE
+    next_state: State = State.IDLE
+    # [y, x] per detected object, normalized to 0-1000, with matching labels
+    points: np.ndarray = field(default_factory=_empty_points)
+    labels: List[str] = field(default_factory=list)
+    claw_has_candle: bool = False
+    is_flame_lit: bool = False
+    is_candle_in_cake: bool = False
+    is_arm_retracted: bool = False
+    instructions: str = ""
+    # Share of consensus answers backing this one, 1.0 for a single call
+    agreement: float = 1.0
+    # Consensus answers backing this one, each counts as an observation
+    votes: int = 1
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "VisionResult":
+        coords, labels = [], []
+        for item in data.get("points") or []:
+            if not isinstance(item, dict):
+                continue
+            point = item.get("point")
+            # A repaired answer can hold anything here, e.g. ["a", 3] or [[1, 2], 3]
+            if isinstance(point, (list, tuple)) and len(point) == 2 and all(
+                    isinstance(v, (int, float)) and not isinstance(v, bool) for v in point):
+                coords.append(point)
+                labels.append(str(item.get("label", "")))
+        points = np.asarray(coords, dtype=np.float32) if coords else _empty_points()
+        return cls(
+            current_state=parse_state(data.get("current_state", State.IDLE)),
+            next_state=parse_state(data.get("next_state", State.IDLE)),
+            points=points,
+            labels=labels,
+            claw_has_candle=data.get("claw_has_candle") is True,
+            is_flame_lit=data.get("is_flame_lit") is True,
+            is_candle_in_cake=data.get("is_candle_in_cake") is True,
+            is_arm_retracted=data.get("is_arm_retracted") is True,
+            instructions=str(data.get("instructions") or ""),
+        )
+
+    def find(self, keywords, exclude=()) -> Optional[np.ndarray]:
+        """[y, x] of the first point whose label contains one of `keywords`."""
+        for label, point in zip(self.labels, self.points):
+            label = label.lower()
+            if any(k in label for k in keywords) and not any(k in label for k in exclude):
+                return point
+        return None
+
+    def points_labels(self) -> list:
+        """Points in the model's JSON shape, e.g. for helper.label_image."""
+        return [{"point": [int(p[0]), int(p[1])], "label": label}
+                for p, label in zip(self.points, self.labels)]
+
+
+class ParseStats:
+    """Counts which parse path responses took and how long parsing took."""
+    def __init__(self):
+        self.strict = 0
+        self.repaired = 0
+        self.failed = 0
+        self.total_s = 0.0
+        self.last_s = 0.0
+
+    def __repr__(self):
+        count = self.strict + self.repaired + self.failed
+        mean_ms = self.total_s / count * 1000 if count else 0.0
+        return (f"ParseStats(strict={self.strict}, repaired={self.repaired}, "
+                f"failed={self.failed}, mean={mean_ms:.2f} ms)")
+
+
+parse_stats = ParseStats()
+
+
+def parse_vision_result(text: str) -> Optional[VisionResult]:
+    """
+    Parses a response into a VisionResult. Schema-constrained answers are
+    plain JSON and take the strict json.loads path; json_repair is only the
+    fallback for malformed text. Returns None if nothing usable comes back.
+    """
+    started = time.perf_counter()
+    try:
+        data = json.loads(text)
+        strict = True
+    except (json.JSONDecodeError, TypeError):
+        # Only malformed answers pay for importing json_repair
+        import json_repair
+        data = json_repair.loads(text) if text else None
+        strict = False
+    result = None
+    if isinstance(data, dict):
+        result = VisionResult.from_dict(data)
+        if strict:
+            parse_stats.strict += 1
+        else:
+            parse_stats.repaired += 1
+    else:
+        parse_stats.failed += 1
+    parse_stats.last_s = time.perf_counter() - started
+    parse_stats.total_s += parse_stats.last_s
+    return result